@@ -2,9 +2,5 @@ from listener.webhook_listener import WebhookListener
 
 if __name__ == "__main__":
     listener = WebhookListener()
-    listener.start()
-    try:
-        while True:
-            pass
-    except KeyboardInterrupt:
-        listener.stop()
\ No newline at end of file
+    # Blocks until SIGINT/SIGTERM, then drains in-flight requests
+    listener.serve_forever()
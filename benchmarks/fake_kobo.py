@@ -0,0 +1,196 @@
+"""Local stand-in for the KoboToolbox v2 API used by the benchmarks
+
+Serves one or more assets with ``assets/<uid>/``, ``data.json`` pagination
+and the deployment endpoint, with an optional fixed latency per request.
+"""
+import json
+import random
+import time
+from bisect import bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from services.option_sync_service import build_value
+from utils.text import full_name
+
+NOMBRES = ["Ana", "Luis", "María", "José", "Juan", "Rosa", "Pedro", "Lucía", "Carlos", "Elena",
+           "Jorge", "Sofía", "Miguel", "Carmen", "Raúl", "Patricia", "Andrés", "Laura"]
+APELLIDOS = ["Pérez", "López", "García", "Martínez", "Hernández", "González", "Rodríguez",
+             "Sánchez", "Ramírez", "Cruz", "Flores", "Gómez", "Díaz", "Reyes", "Morales", "Ortiz"]
+
+
+def fake_people(count: int, seed: int = 42):
+    """Deterministic (nombre, paterno, materno) tuples; materno is sometimes missing"""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield (
+            f"{rng.choice(NOMBRES)} {i}",
+            rng.choice(APELLIDOS),
+            rng.choice(APELLIDOS) if rng.random() > 0.1 else None,
+        )
+
+
+class FakeAsset:
+    """Asset whose choice list holds the first ``choices`` people of ``seed``
+
+    Seeding the registry with the same seed and more rows makes the extra
+    rows the ones a sync has to add.
+    """
+
+    def __init__(self, uid: str, choices: int = 0, submissions: int = 0,
+                 list_name: str = "personas", seed: int = 42):
+        self.uid = uid
+        self.version = 1
+        self.deployed_version_id = self.version_id
+        self.content = {
+            "survey": [
+                {"type": "select_one personas", "name": "persona", "$kuid": "s1"},
+                {"type": "text", "name": "nombre", "$kuid": "s2"},
+            ],
+            "choices": [
+                {"list_name": list_name, "name": build_value(*person), "label": [full_name(*person)],
+                 "$kuid": f"k{i}", "$autovalue": build_value(*person)}
+                for i, person in enumerate(fake_people(choices, seed))
+            ],
+            "settings": {},
+        }
+        self.submissions = [
+            {"_id": i + 1, "_uuid": f"uuid-{i + 1}", "_submission_time": f"2024-01-01T00:00:{i % 60:02d}",
+             "opcion": "no_registrado_en_el_padr_n", "nombre": n, "apellido paterno": p,
+             "apellido materno": m, "grupo": [{"x": i}]}
+            for i, (n, p, m) in enumerate(fake_people(submissions, seed + 1))
+        ]
+        self.submission_ids = [s["_id"] for s in self.submissions]
+
+    @property
+    def version_id(self) -> str:
+        return f"v{self.version}"
+
+    def document(self) -> Dict:
+        return {
+            "uid": self.uid,
+            "version_id": self.version_id,
+            "deployed_version_id": self.deployed_version_id,
+            "content": self.content,
+            "permissions": [{"user": f"u{i}", "permission": "view_asset"} for i in range(20)],
+        }
+
+
+class FakeKoboServer:
+    """Threaded HTTP server emulating the parts of the API this repo calls"""
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.assets: Dict[str, FakeAsset] = {}
+        self.requests = 0
+        self._lock = Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v2/"
+
+    def add_asset(self, uid: str, **options) -> FakeAsset:
+        self.assets[uid] = FakeAsset(uid, **options)
+        return self.assets[uid]
+
+    def start(self) -> "FakeKoboServer":
+        self._thread = Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Optional[Dict] = None, headers: Optional[Dict] = None):
+                payload = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _body(self) -> Dict:
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    return json.loads(raw or b"{}")
+                return {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+
+            def _route(self):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlparse(self.path)
+                parts = [p for p in url.path.split("/") if p]
+                # api / v2 / assets / <uid> / [data.json | deployment]
+                if len(parts) < 4 or parts[:3] != ["api", "v2", "assets"] or parts[3] not in server.assets:
+                    return None, None, url
+                return server.assets[parts[3]], parts[4] if len(parts) > 4 else None, url
+
+            def do_GET(self):
+                asset, sub, url = self._route()
+                if asset is None:
+                    return self._send(404, {"detail": "Not found"})
+                if sub == "data.json":
+                    return self._send(200, self._data_page(asset, url))
+                etag = f'"{asset.version_id}-{asset.deployed_version_id}"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304)
+                self._send(200, asset.document(), {"ETag": etag})
+
+            def do_PATCH(self):
+                asset, sub, _ = self._route()
+                if asset is None:
+                    return self._send(404, {"detail": "Not found"})
+                body = self._body()
+                with server._lock:
+                    if sub == "deployment":
+                        asset.deployed_version_id = body.get("version_id", asset.version_id)
+                    else:
+                        asset.content = body.get("content", asset.content)
+                        asset.version += 1
+                self._send(200, asset.document(),
+                           {"ETag": f'"{asset.version_id}-{asset.deployed_version_id}"'})
+
+            def _data_page(self, asset: FakeAsset, url) -> Dict:
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                limit = int(params.get("limit", 1000))
+                start = int(params.get("start", 0))
+                rows: List[Dict] = asset.submissions
+                query = json.loads(params.get("query", "{}"))
+                after = query.get("_id", {}).get("$gt")
+                # Submissions are kept sorted by _id, so the filter is an offset
+                offset = bisect_right(asset.submission_ids, after) if after is not None else 0
+                count = len(rows) - offset
+                page = rows[offset + start:offset + start + limit]
+                next_url = None
+                if start + limit < count:
+                    next_url = f"{server.base_url}assets/{asset.uid}/data.json?" + urlencode(
+                        {**params, "start": start + limit})
+                return {"count": count, "next": next_url, "results": page}
+
+        return Handler
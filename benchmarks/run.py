@@ -0,0 +1,291 @@
+"""Benchmark choice sync, export and webhook ingestion against local stand-ins
+
+KoboToolbox is replaced by benchmarks.fake_kobo; the registry lives in the
+scratch Postgres named by ``BENCH_DATABASE_URL`` and is reseeded for every
+size. Without it only the export benchmark runs. Results are written as
+JSON so runs of different versions can be compared.
+
+    python -m benchmarks.run --sizes 1k,100k,1m --output results.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from benchmarks.fake_kobo import FakeKoboServer, fake_people
+from benchmarks.seed_db import seed_registry, use_bench_database
+from database.connection_pool import ConnectionPool
+from database.supabase_client import schema_cache
+from kobo_manager import FormManager
+from services.pipeline_service import UpdatePipeline, registry_plan
+
+LIST_NAME = "personas"
+SCENARIOS = ("sync", "export", "webhook")
+SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(text: str) -> int:
+    """``1k`` -> 1000, ``1m`` -> 1000000"""
+    text = text.strip().lower()
+    if text[-1:] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+    return int(text)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of ``samples``"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def summarize(latencies: List[float], items: int, elapsed: float) -> Dict[str, Any]:
+    """Throughput (items/s) and latency percentiles in milliseconds"""
+    return {
+        "samples": len(latencies),
+        "items": items,
+        "elapsed_s": round(elapsed, 4),
+        "throughput": round(items / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0.0) * 1000, 3),
+    }
+
+
+def bench_export(server: FakeKoboServer, rows: int, repeats: int, page_size: int,
+                 fmt: str) -> Dict[str, Any]:
+    """Full export of ``rows`` submissions; one sample per export"""
+    server.add_asset("bench_export", submissions=rows)
+    latencies = []
+    stats = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / f"export.{fmt}"
+        for _ in range(repeats):
+            with FormManager("bench", "bench_export", base_url=server.base_url) as form:
+                started = time.perf_counter()
+                written = form.export_data(str(path), fmt=fmt, resume=False, page_size=page_size)
+                latencies.append(time.perf_counter() - started)
+                stats = form.stats.as_dict()
+            if written != rows:
+                raise RuntimeError(f"Exported {written} of {rows} submissions")
+    return {**summarize(latencies, rows * repeats, sum(latencies)), "requests": stats}
+
+
+def bench_sync(server: FakeKoboServer, db_config: Dict, rows: int, repeats: int,
+               new_fraction: float) -> Dict[str, Any]:
+    """Registry -> choice list sync where ``new_fraction`` of the rows are new
+
+    One sample per fetch/diff/patch/deploy run; each run starts from a
+    fresh asset so every repeat does the same work.
+    """
+    existing = rows - int(rows * new_fraction)
+    latencies = []
+    stages: Dict[str, List[float]] = {}
+    added = 0
+    for _ in range(repeats):
+        server.add_asset("bench_sync", choices=existing, list_name=LIST_NAME)
+        with FormManager("bench", "bench_sync", base_url=server.base_url) as form:
+            started = time.perf_counter()
+            result = UpdatePipeline(form).run(registry_plan(db_config, LIST_NAME))
+            latencies.append(time.perf_counter() - started)
+        if not result.ok:
+            raise RuntimeError(f"Sync failed: {result.error}")
+        added = result.changes.get("added", 0)
+        for stage, took in result.timings.items():
+            stages.setdefault(stage, []).append(took)
+    return {
+        **summarize(latencies, rows * repeats, sum(latencies)),
+        "existing_choices": existing,
+        "added": added,
+        "stages_p50_ms": {stage: round(percentile(t, 50) * 1000, 3) for stage, t in stages.items()},
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench_webhook(registry_rows: int, requests_count: int, concurrency: int, async_ingest: bool,
+                  duplicate_fraction: float, drain_timeout: float = 300.0) -> Dict[str, Any]:
+    """POST registrations to a local listener; one sample per request
+
+    ``duplicate_fraction`` of the payloads are names already seeded into
+    the registry. With ``async_ingest`` throughput includes draining the
+    queue, while the latencies are those of the 202 responses.
+    """
+    # Imported here: the listener pulls in Flask/waitress
+    from listener.webhook_listener import REGISTRATION_OPTION, WebhookListener
+
+    duplicates = min(int(requests_count * duplicate_fraction), registry_rows)
+    payloads = [
+        {"_uuid": f"bench-{i}", "opcion": REGISTRATION_OPTION, "nombre": n,
+         "apellido paterno": p, "apellido materno": m}
+        for i, (n, p, m) in enumerate(fake_people(duplicates))
+    ] + [
+        {"_uuid": f"bench-new-{i}", "opcion": REGISTRATION_OPTION, "nombre": f"Nuevo {n}",
+         "apellido paterno": p, "apellido materno": m}
+        for i, (n, p, m) in enumerate(fake_people(requests_count - duplicates, seed=7))
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["WEBHOOK_QUEUE_PATH"] = str(Path(tmp) / "ingest_queue.db")
+        port = _free_port()
+        listener = WebhookListener(async_ingest=async_ingest, host="127.0.0.1", port=port, tunnel=False)
+        listener.start()
+        url = f"http://127.0.0.1:{port}/"
+        local = threading.local()
+        statuses: Dict[int, int] = {}
+        status_lock = threading.Lock()
+
+        def post(payload: Dict) -> float:
+            if not hasattr(local, "session"):
+                local.session = requests.Session()
+            started = time.perf_counter()
+            response = local.session.post(url, json=payload, timeout=60)
+            took = time.perf_counter() - started
+            with status_lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            return took
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                latencies = list(executor.map(post, payloads))
+            posted = time.perf_counter() - started
+            if listener.queue is not None:
+                deadline = time.monotonic() + drain_timeout
+                while listener.queue.depth() and time.monotonic() < deadline:
+                    time.sleep(0.05)
+            elapsed = time.perf_counter() - started
+            drain = listener.workers.snapshot() if listener.workers is not None else None
+        finally:
+            listener.stop(drain_timeout=5)
+
+    return {
+        **summarize(latencies, len(payloads), elapsed),
+        "async": async_ingest,
+        "concurrency": concurrency,
+        "duplicates": duplicates,
+        "post_elapsed_s": round(posted, 4),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "drain": drain,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            check=True, cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> Dict[str, Any]:
+    db_config = use_bench_database(args.database_url)
+    # Never push benchmark names to a real form
+    os.environ.pop("KOBO_OPTION_LIST", None)
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": {k: v for k, v in vars(args).items() if k != "database_url"},
+        },
+        "results": [],
+    }
+
+    def record(scenario: str, rows: int, measure):
+        entry = {"scenario": scenario, "rows": rows}
+        print(f"{scenario} @ {rows} rows ...", flush=True)
+        try:
+            entry.update(measure())
+        except Exception as e:
+            entry["error"] = str(e)
+        report["results"].append(entry)
+
+    with FakeKoboServer(latency=args.latency) as server:
+        for rows in args.sizes:
+            if db_config is not None and {"sync", "webhook"} & set(args.scenarios):
+                print(f"Seeding {rows} rows ...", flush=True)
+                seed_registry(db_config, rows, name_key=args.name_key, unique=args.unique)
+                # The table was recreated: drop cached schemas and connections
+                schema_cache.invalidate()
+                ConnectionPool.close_all()
+
+            for scenario in args.scenarios:
+                if scenario != "export" and db_config is None:
+                    report["results"].append({"scenario": scenario, "rows": rows,
+                                              "skipped": "BENCH_DATABASE_URL not set"})
+                elif scenario == "export":
+                    record(scenario, rows, lambda: bench_export(
+                        server, rows, args.repeats, args.page_size, args.format))
+                elif scenario == "sync":
+                    record(scenario, rows, lambda: bench_sync(
+                        server, db_config, rows, args.repeats, args.new_fraction))
+                else:
+                    record(scenario, rows, lambda: bench_webhook(
+                        rows, args.webhook_requests, args.concurrency, args.webhook_async,
+                        args.duplicate_fraction))
+    ConnectionPool.close_all()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the KoboFormAutomation benchmarks")
+    parser.add_argument("--sizes", default="1k,100k,1m",
+                        type=lambda s: [parse_size(x) for x in s.split(",")],
+                        help="registry/submission row counts (default: 1k,100k,1m)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda s: [x.strip() for x in s.split(",")],
+                        help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per sync/export sample")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the fake API waits before every response")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--format", default="ndjson", choices=["ndjson", "csv", "parquet", "sqlite", "duckdb"])
+    parser.add_argument("--new-fraction", type=float, default=0.1,
+                        help="share of registry rows missing from the choice list")
+    parser.add_argument("--webhook-requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--webhook-async", action="store_true", help="benchmark queued ingestion")
+    parser.add_argument("--duplicate-fraction", type=float, default=0.2,
+                        help="share of webhook payloads already in the registry")
+    parser.add_argument("--name-key", action="store_true", help="seed with the name_key index")
+    parser.add_argument("--unique", action="store_true", help="seed with a unique name_key index")
+    parser.add_argument("--database-url", help="defaults to BENCH_DATABASE_URL")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+        print(f"Results written to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
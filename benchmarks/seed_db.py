@@ -0,0 +1,106 @@
+"""Seed a scratch Postgres database with a KoboOptionUpdateTest registry
+
+The table is dropped and recreated, so this only connects to the database
+named by ``BENCH_DATABASE_URL``; the SUPABASE_* settings in ``.env`` are
+ignored (and overridden in-process, see use_bench_database). Any local
+Postgres works, e.g. ``docker run -e POSTGRES_PASSWORD=bench -p 5433:5432 postgres``.
+
+    python -m benchmarks.seed_db --rows 100000 [--name-key] [--unique]
+"""
+import argparse
+import io
+import os
+import time
+from typing import Any, Dict, Optional
+
+import psycopg2
+from psycopg2.extensions import parse_dsn
+
+from benchmarks.fake_kobo import fake_people
+from database.name_index import ensure_name_key
+from database.supabase_client import REGISTRY_TABLE, db_config_from_env
+
+COPY_CHUNK = 50_000
+COPY_NULL = r"\N"
+
+
+def use_bench_database(url: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Point the SUPABASE_* settings of this process at the benchmark database
+
+    Code that reads its connection from the environment (the webhook
+    listener, ``get_pool()``) then uses the same shared pool as the
+    benchmark. Returns the connection config, None if not configured.
+    """
+    url = url or os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        return None
+    dsn = parse_dsn(url)
+    for env, key in (("SUPABASE_HOST", "host"), ("SUPABASE_PORT", "port"), ("SUPABASE_DB", "dbname"),
+                     ("SUPABASE_USER", "user"), ("SUPABASE_PASSWORD", "password")):
+        if key in dsn:
+            os.environ[env] = dsn[key]
+        else:
+            os.environ.pop(env, None)
+    return db_config_from_env()
+
+
+def seed_registry(config: Dict[str, Any], rows: int, seed: int = 42,
+                  name_key: bool = False, unique: bool = False) -> float:
+    """Recreate the registry table with ``rows`` generated people
+
+    Rows are loaded with COPY in chunks. ``name_key`` adds the generated
+    lookup column (see database.name_index). Returns the seconds taken.
+    """
+    started = time.perf_counter()
+    connection = psycopg2.connect(**config)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS public."{REGISTRY_TABLE}"')
+            cursor.execute(f'''
+                CREATE TABLE public."{REGISTRY_TABLE}" (
+                    id bigserial PRIMARY KEY,
+                    nombre text NOT NULL,
+                    "apellido paterno" text NOT NULL,
+                    "apellido materno" text,
+                    opcion text,
+                    created_at timestamptz DEFAULT now()
+                )
+            ''')
+            people = fake_people(rows, seed)
+            remaining = rows
+            while remaining:
+                buffer = io.StringIO()
+                for _ in range(min(COPY_CHUNK, remaining)):
+                    nombre, paterno, materno = next(people)
+                    buffer.write(f"{nombre}\t{paterno}\t{materno or COPY_NULL}\n")
+                remaining -= min(COPY_CHUNK, remaining)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY public."{REGISTRY_TABLE}" (nombre, "apellido paterno", "apellido materno") '
+                    f'FROM STDIN',
+                    buffer
+                )
+        connection.commit()
+        if name_key or unique:
+            ensure_name_key(connection, REGISTRY_TABLE, unique=unique)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE public."{REGISTRY_TABLE}"')
+        connection.commit()
+    finally:
+        connection.close()
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the benchmark registry table")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--name-key", action="store_true", help="add the name_key column and index")
+    parser.add_argument("--unique", action="store_true", help="make the name_key index unique")
+    args = parser.parse_args()
+
+    config = use_bench_database()
+    if config is None:
+        parser.error("Set BENCH_DATABASE_URL to a scratch Postgres database")
+    took = seed_registry(config, args.rows, args.seed, name_key=args.name_key, unique=args.unique)
+    print(f"Seeded {args.rows} rows into {REGISTRY_TABLE} in {took:.1f}s")
@@ -0,0 +1,110 @@
+"""Measure import and startup time of the entry points
+
+Every module is imported in a fresh interpreter with ``-X importtime``;
+the median over ``--repeats`` runs is reported with the slowest direct
+imports. Entry points must not load the packages listed in LAZY_IMPORTS at
+import time; they are only needed by some menu actions or commands.
+
+    python -m benchmarks.startup --budget kobo_manager_cli=250 --output startup.json
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+ENTRY_POINTS = ("kobo_manager_cli", "autoupdater", "kobo_manager", "listener.webhook_listener")
+# Packages each entry point has to load lazily
+LAZY_IMPORTS = {
+    "kobo_manager_cli": ("flask", "pyngrok", "keyring", "rich", "psycopg2", "httpx", "duckdb"),
+    "autoupdater": ("pyngrok", "keyring", "rich", "httpx", "duckdb"),
+    "kobo_manager": ("flask", "pyngrok", "keyring", "rich", "psycopg2", "httpx", "duckdb"),
+    "listener.webhook_listener": ("pyngrok", "keyring", "rich", "httpx", "duckdb"),
+}
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, str, int, int]]:
+    """``(depth, module, self_us, cumulative_us)`` for every ``-X importtime`` line"""
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append(((len(indent) - 1) // 2, module, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def measure(module: str) -> Dict[str, Any]:
+    """Import ``module`` once in a new interpreter"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    entries = parse_importtime(result.stderr)
+    total = next(cum for depth, name, _, cum in reversed(entries) if depth == 0 and name == module)
+    # Direct imports of the entry point and the packages they pulled in
+    children = [(name, cum) for depth, name, _, cum in entries if depth == 1]
+    loaded = {name.split(".")[0] for _, name, _, _ in entries}
+    return {"import_us": total, "wall_s": wall, "children": children, "loaded": loaded}
+
+
+def profile(module: str, repeats: int, top: int) -> Dict[str, Any]:
+    runs = [measure(module) for _ in range(repeats)]
+    slowest = sorted(runs[-1]["children"], key=lambda child: child[1], reverse=True)[:top]
+    eager = sorted(set(LAZY_IMPORTS.get(module, ())) & runs[-1]["loaded"])
+    return {
+        "module": module,
+        "import_ms": round(statistics.median(r["import_us"] for r in runs) / 1000, 2),
+        "startup_ms": round(statistics.median(r["wall_s"] for r in runs) * 1000, 2),
+        "slowest_imports_ms": {name: round(cum / 1000, 2) for name, cum in slowest},
+        "eager_imports": eager,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure entry point import/startup time")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest direct imports to list")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="fail if the median import time of MODULE exceeds MS")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    budgets = {}
+    for budget in args.budget:
+        module, _, limit = budget.partition("=")
+        budgets[module] = float(limit)
+
+    results = [profile(module, args.repeats, args.top) for module in args.modules]
+    failures = []
+    for result in results:
+        if result["eager_imports"]:
+            failures.append(f"{result['module']} imports {', '.join(result['eager_imports'])} at startup")
+        limit = budgets.get(result["module"])
+        if limit is not None and result["import_ms"] > limit:
+            failures.append(f"{result['module']} imports in {result['import_ms']} ms (budget {limit:g} ms)")
+
+    text = json.dumps({"python": sys.version.split()[0], "results": results, "failures": failures}, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+        print(f"Results written to {args.output}")
+    else:
+        print(text)
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
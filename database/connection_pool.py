@@ -0,0 +1,231 @@
+import time
+from dataclasses import dataclass
+from threading import Condition, Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+
+@dataclass
+class PoolStats:
+    """Borrow and wait counters for a ConnectionPool"""
+    acquired: int = 0
+    created: int = 0
+    discarded: int = 0
+    waits: int = 0
+    timeouts: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def record_wait(self, waited: float):
+        self.waits += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "acquired": self.acquired,
+            "created": self.created,
+            "discarded": self.discarded,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "total_wait": round(self.total_wait, 4),
+            "max_wait": round(self.max_wait, 4),
+        }
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became available in time"""
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool
+
+    ``min_size`` connections are opened on construction, so the first
+    requests don't wait for a connect. Idle connections are reused most-recently-used first. A connection idle
+    for longer than ``health_check_after`` is pinged before being handed out,
+    and connections idle for ``max_idle`` seconds (above ``min_size``) or
+    older than ``max_lifetime`` are closed. When all ``max_size``
+    connections are in use, ``acquire`` waits up to ``timeout`` seconds.
+    """
+
+    _shared: Dict[Tuple, "ConnectionPool"] = {}
+    _shared_lock = Lock()
+
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        max_idle: float = 300.0,
+        max_lifetime: float = 3600.0,
+        health_check_after: float = 30.0,
+    ):
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self.stats = PoolStats()
+        # (connection, created_at, last_used) for idle connections
+        self._idle: List[Tuple[Any, float, float]] = []
+        self._created_at: Dict[int, float] = {}
+        self._in_use = 0
+        self._cond = Condition()
+        self._closed = False
+        self._open_min()
+
+    def _open_min(self):
+        """Open idle connections until ``min_size`` exist"""
+        try:
+            while self.size < self.min_size:
+                connection = self._connect()
+                now = time.monotonic()
+                self._idle.append((connection, now, now))
+        except psycopg2.Error:
+            self.close()
+            raise
+
+    @classmethod
+    def shared(cls, config: Dict[str, Any], **options) -> "ConnectionPool":
+        """Process-wide pool for a connection config (created on first use)"""
+        key = tuple(sorted((k, repr(v)) for k, v in config.items()))
+        with cls._shared_lock:
+            pool = cls._shared.get(key)
+            if pool is None or pool._closed:
+                pool = cls._shared[key] = cls(config, **options)
+            return pool
+
+    @classmethod
+    def close_all(cls):
+        with cls._shared_lock:
+            for pool in cls._shared.values():
+                pool.close()
+            cls._shared.clear()
+
+    @property
+    def size(self) -> int:
+        return self._in_use + len(self._idle)
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def _connect(self):
+        connection = psycopg2.connect(**self.config)
+        self._created_at[id(connection)] = time.monotonic()
+        self.stats.created += 1
+        return connection
+
+    def _discard(self, connection):
+        self._created_at.pop(id(connection), None)
+        self.stats.discarded += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    @staticmethod
+    def _is_alive(connection) -> bool:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _recycle_idle(self, now: float):
+        """Close idle connections past max_idle / max_lifetime (lock held)"""
+        total = self.size
+        keep = []
+        # Oldest-used first, so the most recently used ones survive
+        for entry in self._idle:
+            connection, created, last_used = entry
+            expired = now - created > self.max_lifetime
+            stale = now - last_used > self.max_idle and total > self.min_size
+            if connection.closed or expired or stale:
+                self._discard(connection)
+                total -= 1
+            else:
+                keep.append(entry)
+        self._idle = keep
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Borrow a connection, waiting if the pool is exhausted"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                now = time.monotonic()
+                self._recycle_idle(now)
+                if self._idle:
+                    connection, _, last_used = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self.size < self.max_size:
+                    connection, last_used = None, now
+                    self._in_use += 1
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.stats.timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self.stats.record_wait(time.monotonic() - started)
+            self.stats.acquired += 1
+
+        # Connecting and pinging happen outside the lock
+        try:
+            if connection is not None and time.monotonic() - last_used > self.health_check_after:
+                if not self._is_alive(connection):
+                    with self._cond:
+                        self._discard(connection)
+                    connection = None
+            if connection is None:
+                connection = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return connection
+
+    def release(self, connection, discard: bool = False):
+        """Return a borrowed connection; broken ones are closed instead"""
+        with self._cond:
+            self._in_use -= 1
+            if not discard and not connection.closed and not self._closed:
+                try:
+                    if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                        connection.rollback()
+                except psycopg2.Error:
+                    discard = True
+            else:
+                discard = True
+
+            if discard:
+                self._discard(connection)
+            else:
+                now = time.monotonic()
+                self._idle.append((connection, self._created_at.get(id(connection), now), now))
+            self._cond.notify()
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed on release"""
+        with self._cond:
+            self._closed = True
+            for connection, _, _ in self._idle:
+                self._discard(connection)
+            self._idle = []
+            self._cond.notify_all()
@@ -0,0 +1,141 @@
+import hashlib
+import math
+import time
+from threading import Lock
+from typing import Iterable, Optional
+
+from utils.text import FOLD_PAIRS
+
+NAME_KEY_COLUMN = "name_key"
+
+# Matches utils.text.name_key(): lowercase, accents folded with the same
+# table (TRANSLATE; registry_key folds nothing else either), whitespace
+# collapsed, missing parts treated as empty. Only immutable functions
+# (COALESCE is; CONCAT and unaccent are not) so it can back a generated
+# column.
+_FOLD_FROM = "".join(char for char, _ in FOLD_PAIRS)
+_FOLD_TO = "".join(plain for _, plain in FOLD_PAIRS)
+NAME_KEY_EXPRESSION = f'''BTRIM(REGEXP_REPLACE(TRANSLATE(LOWER(
+    COALESCE(nombre, '') || ' ' || COALESCE("apellido paterno", '') || ' ' || COALESCE("apellido materno", '')
+), '{_FOLD_FROM}', '{_FOLD_TO}'), '\\s+', ' ', 'g'))'''
+
+
+def _outdated(expression: Optional[str]) -> bool:
+    """True for a name_key generated by an earlier NAME_KEY_EXPRESSION
+
+    Postgres stores the expression reformatted, so look for what older
+    versions lacked: the accent-folding TRANSLATE and a COALESCE per part.
+    """
+    expression = (expression or "").lower()
+    return "translate" not in expression or expression.count("coalesce") < 3
+
+
+def ensure_name_key(connection, table: str = "KoboOptionUpdateTest", unique: bool = False):
+    """Add the generated ``name_key`` column and its index if missing
+
+    ``unique`` creates a unique index instead, which rejects duplicate
+    names at the database level; it fails if the table already holds
+    duplicates. A ``name_key`` generated by an older expression (without
+    accent folding or NULL handling) is dropped and rebuilt; a plain
+    ``name_key`` column holds data of its own and raises RuntimeError.
+    """
+    index = f"{table}_name_key_{'key' if unique else 'idx'}"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT is_generated, generation_expression FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s AND column_name = %s
+            """,
+            (table, NAME_KEY_COLUMN)
+        )
+        row = cursor.fetchone()
+        if row and row[0] != "ALWAYS":
+            connection.rollback()
+            raise RuntimeError(
+                f'public."{table}".{NAME_KEY_COLUMN} exists but is not a generated column; '
+                f"rename or drop it before running this migration"
+            )
+        if row and _outdated(row[1]):
+            cursor.execute(f'ALTER TABLE public."{table}" DROP COLUMN {NAME_KEY_COLUMN}')
+        cursor.execute(f'''
+            ALTER TABLE public."{table}"
+            ADD COLUMN IF NOT EXISTS {NAME_KEY_COLUMN} text
+            GENERATED ALWAYS AS ({NAME_KEY_EXPRESSION}) STORED
+        ''')
+        cursor.execute(f'''
+            CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS "{index}"
+            ON public."{table}" ({NAME_KEY_COLUMN})
+        ''')
+    connection.commit()
+
+
+class NameFilter:
+    """Bloom filter over the registry's name keys
+
+    A miss means the name is certainly not in the table, so the lookup
+    query can be skipped. Hits still go to the database. The filter is
+    rebuilt every ``refresh_after`` seconds to pick up rows inserted by
+    other processes.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01,
+                 refresh_after: float = 300.0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_after = refresh_after
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = Lock()
+        self.count = 0
+        self.loaded_at: Optional[float] = None
+
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        with self._lock:
+            for pos in self._positions(key):
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_after
+
+    def load(self, connection, table: str = "KoboOptionUpdateTest", batch_size: int = 10_000):
+        """Rebuild the filter from the ``name_key`` column"""
+        bits = bytearray(len(self._bits))
+        count = 0
+        with connection.cursor(name="kobo_name_filter") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(f'SELECT {NAME_KEY_COLUMN} FROM public."{table}" WHERE {NAME_KEY_COLUMN} IS NOT NULL')
+            for row in cursor:
+                for pos in self._positions(row[0]):
+                    bits[pos >> 3] |= 1 << (pos & 7)
+                count += 1
+        connection.rollback()
+        with self._lock:
+            self._bits = bits
+            self.count = count
+            self.loaded_at = time.monotonic()
+
+
+if __name__ == "__main__":
+    import sys
+    from database.supabase_client import get_pool, schema_cache
+
+    pool = get_pool()
+    connection = pool.acquire()
+    try:
+        ensure_name_key(connection, unique="--unique" in sys.argv)
+    finally:
+        pool.release(connection)
+    schema_cache.invalidate()
+    print(f"{NAME_KEY_COLUMN} column and index are in place")
@@ -0,0 +1,126 @@
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+class TableSchema:
+    """Column set of one table plus memoised key mapping and INSERT statements"""
+
+    def __init__(self, schema: str, table: str, columns: Iterable[str],
+                 normalize: Callable[[str], str], generated: Iterable[str] = (),
+                 unique: Iterable[str] = (), max_statements: int = 256):
+        self.schema = schema
+        self.table = table
+        # Insertable columns; generated ones are tracked separately
+        self.columns = frozenset(columns)
+        self.generated = frozenset(generated)
+        # Columns with a single-column unique index (usable as ON CONFLICT target)
+        self.unique = frozenset(unique)
+        self.loaded_at = time.monotonic()
+        self._normalize = normalize
+        self._key_map: Dict[str, Optional[str]] = {}
+        self._statements: Dict[Tuple[str, ...], str] = {}
+        self._max_statements = max_statements
+
+    def column_for(self, key: str) -> Optional[str]:
+        """Column a payload key maps to, or None if the table has no such column"""
+        try:
+            return self._key_map[key]
+        except KeyError:
+            column = self._normalize(key)
+            column = self._key_map[key] = column if column in self.columns else None
+            return column
+
+    def map_row(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Rename payload keys to table columns, dropping unknown keys"""
+        row = {}
+        for key, value in data.items():
+            column = self.column_for(key)
+            if column is not None:
+                row[column] = value
+        return row
+
+    @staticmethod
+    def quote(identifier: str) -> str:
+        return '"' + identifier.replace('"', '""') + '"'
+
+    def insert_sql(self, columns: Tuple[str, ...]) -> str:
+        """INSERT statement for a column tuple, built once per column set"""
+        return self._statement(("row",) + columns, lambda: f'''
+            INSERT INTO {self.quote(self.schema)}.{self.quote(self.table)} ({', '.join(map(self.quote, columns))})
+            VALUES ({', '.join(['%s'] * len(columns))})
+        ''')
+
+    def bulk_insert_sql(self, columns: Tuple[str, ...], conflict_column: Optional[str] = None) -> str:
+        """Multi-row INSERT for ``psycopg2.extras.execute_values``
+
+        Returns one row per inserted record; with ``conflict_column`` rows
+        that collide on that unique column are skipped and the returned
+        rows hold the inserted values of that column.
+        """
+        conflict = f"ON CONFLICT ({self.quote(conflict_column)}) DO NOTHING" if conflict_column else ""
+        returning = self.quote(conflict_column) if conflict_column else "1"
+        return self._statement(("bulk", conflict_column or "") + columns, lambda: f'''
+            INSERT INTO {self.quote(self.schema)}.{self.quote(self.table)} ({', '.join(map(self.quote, columns))})
+            VALUES %s {conflict}
+            RETURNING {returning}
+        ''')
+
+    def _statement(self, key: Tuple[str, ...], build: Callable[[], str]) -> str:
+        query = self._statements.get(key)
+        if query is None:
+            if len(self._statements) >= self._max_statements:
+                self._statements.clear()
+            query = self._statements[key] = build()
+        return query
+
+
+class SchemaCache:
+    """Process-wide cache of TableSchema objects with a TTL"""
+
+    def __init__(self, ttl: float = 600.0):
+        self.ttl = ttl
+        self._schemas: Dict[Tuple[str, str], TableSchema] = {}
+        self._lock = Lock()
+
+    def get(self, connection, table: str, normalize: Callable[[str], str],
+            schema: str = "public") -> TableSchema:
+        """Cached schema for ``schema.table``, loaded through ``connection`` if stale"""
+        key = (schema, table)
+        with self._lock:
+            cached = self._schemas.get(key)
+        if cached is not None and time.monotonic() - cached.loaded_at < self.ttl:
+            return cached
+
+        with connection.cursor() as cursor:
+            cursor.execute('''
+                SELECT column_name, is_generated
+                FROM information_schema.columns
+                WHERE table_schema = %s
+                AND table_name = %s
+            ''', (schema, table))
+            rows = cursor.fetchall()
+            cursor.execute('''
+                SELECT a.attname
+                FROM pg_index i
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+                WHERE i.indrelid = %s::regclass
+                AND i.indisunique
+                AND i.indnatts = 1
+            ''', (f'{TableSchema.quote(schema)}.{TableSchema.quote(table)}',))
+            unique = [row[0] for row in cursor.fetchall()]
+
+        columns = [name for name, generated in rows if generated == "NEVER"]
+        generated = [name for name, generated in rows if generated != "NEVER"]
+        loaded = TableSchema(schema, table, columns, normalize, generated=generated, unique=unique)
+        with self._lock:
+            self._schemas[key] = loaded
+        return loaded
+
+    def invalidate(self, table: Optional[str] = None, schema: str = "public"):
+        """Forget one table (or every table) so the next get reloads it"""
+        with self._lock:
+            if table is None:
+                self._schemas.clear()
+            else:
+                self._schemas.pop((schema, table), None)
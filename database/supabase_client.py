@@ -1,20 +1,60 @@
 import os
 import psycopg2
-from typing import Dict, Optional
-from psycopg2.extras import DictCursor
+import psycopg2.errors
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from psycopg2.extras import DictCursor, execute_values
+from database.connection_pool import ConnectionPool
+from database.name_index import NAME_KEY_COLUMN, NAME_KEY_EXPRESSION, NameFilter
+from database.schema_cache import SchemaCache
+from threading import Lock
+from utils.metrics import metrics
+from utils.text import name_key, registry_key
+
+REGISTRY_TABLE = "KoboOptionUpdateTest"
+
+# Shared by every client so the column list is loaded once per TTL
+schema_cache = SchemaCache(ttl=float(os.getenv("SUPABASE_SCHEMA_TTL", 600)))
+
+# Enabled with SUPABASE_NAME_PREFILTER=1, see SupabaseClient._name_filter
+_name_filter: Optional[NameFilter] = None
+_name_filter_lock = Lock()
+
+DB_QUERY_SECONDS = metrics.histogram(
+    "supabase_query_seconds", "Registry query time, including commit for writes", ("query",)
+)
+
+
+def db_config_from_env() -> Dict[str, Any]:
+    """Supabase connection settings from the environment"""
+    return {
+        'host': os.getenv("SUPABASE_HOST"),
+        'port': os.getenv("SUPABASE_PORT", 5432),
+        'database': os.getenv("SUPABASE_DB"),
+        'user': os.getenv("SUPABASE_USER"),
+        'password': os.getenv("SUPABASE_PASSWORD"),
+        'cursor_factory': DictCursor
+    }
+
+
+def get_pool(config: Optional[Dict[str, Any]] = None) -> ConnectionPool:
+    """Process-wide pool for the Supabase database"""
+    return ConnectionPool.shared(
+        config or db_config_from_env(),
+        min_size=int(os.getenv("SUPABASE_POOL_MIN", 1)),
+        max_size=int(os.getenv("SUPABASE_POOL_MAX", 10)),
+    )
+
 
 class SupabaseClient:
-    """Manages PostgreSQL connections and operations for Supabase"""
+    """Manages PostgreSQL connections and operations for Supabase
+
+    Connections are borrowed from a shared ConnectionPool on ``connect`` and
+    returned on ``disconnect``, so short-lived clients don't reconnect.
+    """
     
-    def __init__(self):
-        self.config = {
-            'host': os.getenv("SUPABASE_HOST"),
-            'port': os.getenv("SUPABASE_PORT", 5432),
-            'database': os.getenv("SUPABASE_DB"),
-            'user': os.getenv("SUPABASE_USER"),
-            'password': os.getenv("SUPABASE_PASSWORD"),
-            'cursor_factory': DictCursor
-        }
+    def __init__(self, pool: Optional[ConnectionPool] = None):
+        self.pool = pool or get_pool()
+        self.config = self.pool.config
         self.connection = None
 
     def __enter__(self):
@@ -22,63 +62,161 @@ class SupabaseClient:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.disconnect()
+        if exc_type is not None and self.connection and not self.connection.closed:
+            try:
+                self.connection.rollback()
+            except psycopg2.Error:
+                pass
+        self.disconnect(discard=isinstance(exc_val, psycopg2.OperationalError))
 
     def connect(self):
-        """Establish database connection"""
+        """Borrow a connection from the pool"""
         if not self.connection or self.connection.closed:
-            self.connection = psycopg2.connect(**self.config)
+            self.connection = self.pool.acquire()
 
-    def disconnect(self):
-        """Close database connection"""
-        if self.connection and not self.connection.closed:
-            self.connection.close()
+    def disconnect(self, discard: bool = False):
+        """Return the connection to the pool"""
+        if self.connection:
+            self.pool.release(self.connection, discard=discard)
+            self.connection = None
 
     def check_existing_entry(self, full_name: str) -> bool:
-        """Check if entry exists in the database"""
+        """Check if entry exists in the database
+
+        Uses the indexed ``name_key`` column when the migration in
+        ``database.name_index`` has been applied, and the optional in-process
+        name filter to skip the query for names that are certainly new.
+        """
+        key = registry_key(full_name)
+        name_filter = self._name_filter()
+        if name_filter is not None and key not in name_filter:
+            return False
+
+        schema = schema_cache.get(self.connection, REGISTRY_TABLE, self._normalize_key)
         with self.connection.cursor() as cursor:
-            check_query = '''
-                SELECT EXISTS (
-                    SELECT 1 FROM public."KoboOptionUpdateTest"
-                    WHERE LOWER(CONCAT(
-                        nombre, ' ', 
-                        "apellido paterno", ' ', 
-                        COALESCE("apellido materno", '')
-                    )) = LOWER(%s)
-                )
-            '''
-            cursor.execute(check_query, (full_name,))
-            return cursor.fetchone()[0]
+            if NAME_KEY_COLUMN in schema.generated:
+                check_query = f'''
+                    SELECT EXISTS (
+                        SELECT 1 FROM public."{REGISTRY_TABLE}"
+                        WHERE {NAME_KEY_COLUMN} = %s
+                    )
+                '''
+            else:
+                check_query = f'''
+                    SELECT EXISTS (
+                        SELECT 1 FROM public."{REGISTRY_TABLE}"
+                        WHERE {NAME_KEY_EXPRESSION} = %s
+                    )
+                '''
+            with DB_QUERY_SECONDS.time(query="check_existing"):
+                cursor.execute(check_query, (key,))
+                return cursor.fetchone()[0]
+
+    def _name_filter(self) -> Optional[NameFilter]:
+        """Shared name filter, (re)loaded when stale; None when disabled"""
+        global _name_filter
+        if os.getenv("SUPABASE_NAME_PREFILTER", "0") != "1":
+            return None
+        with _name_filter_lock:
+            if _name_filter is None:
+                _name_filter = NameFilter(capacity=int(os.getenv("SUPABASE_NAME_PREFILTER_CAPACITY", 1_000_000)))
+            if _name_filter.stale:
+                schema = schema_cache.get(self.connection, REGISTRY_TABLE, self._normalize_key)
+                if NAME_KEY_COLUMN not in schema.generated:
+                    return None
+                _name_filter.load(self.connection, REGISTRY_TABLE)
+        return _name_filter
 
     def insert_registration(self, data: Dict) -> bool:
-        """Insert new registration into database"""
+        """Insert new registration into database
+
+        The table's columns come from a shared schema cache; it is reloaded
+        once if the insert hits a column that no longer exists.
+        """
+        for attempt in range(2):
+            schema = schema_cache.get(self.connection, REGISTRY_TABLE, self._normalize_key)
+            normalized_data = schema.map_row(data)
+            query = schema.insert_sql(tuple(normalized_data))
+            try:
+                with DB_QUERY_SECONDS.time(query="insert"):
+                    with self.connection.cursor() as cursor:
+                        cursor.execute(query, list(normalized_data.values()))
+                    self.connection.commit()
+                if _name_filter is not None:
+                    _name_filter.add(self._row_name_key(normalized_data))
+                return True
+            except psycopg2.errors.UndefinedColumn:
+                self.connection.rollback()
+                schema_cache.invalidate(REGISTRY_TABLE)
+                if attempt:
+                    raise
+
+    def insert_registrations(self, records: Iterable[Dict], page_size: int = 1000) -> Dict[str, Any]:
+        """Insert many registrations in multi-row statements
+
+        Records are grouped by column set. Names already in the table, or
+        repeated within ``records``, are skipped: through ``ON CONFLICT`` when
+        ``name_key`` has a unique index, otherwise with one lookup query for
+        the whole batch. Returns inserted and skipped counts, and the
+        inserted records themselves under ``records``.
+        """
+        schema = schema_cache.get(self.connection, REGISTRY_TABLE, self._normalize_key)
+        conflict_column = NAME_KEY_COLUMN if NAME_KEY_COLUMN in schema.unique else None
+
+        total = 0
+        keys = set()
+        groups: Dict[Tuple[str, ...], List[Tuple[str, List, Dict]]] = {}
+        for data in records:
+            total += 1
+            row = schema.map_row(data)
+            key = self._row_name_key(row)
+            if key:
+                if key in keys:
+                    continue
+                keys.add(key)
+            groups.setdefault(tuple(row), []).append((key, list(row.values()), data))
+
         with self.connection.cursor() as cursor:
-            # Get table columns
-            cursor.execute('''
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_schema = 'public' 
-                AND table_name = 'KoboOptionUpdateTest'
-            ''')
-            table_columns = [col[0] for col in cursor.fetchall()]
-
-            # Prepare data
-            normalized_data = {
-                self._normalize_key(k): v 
-                for k, v in data.items()
-                if self._normalize_key(k) in table_columns
-            }
-
-            # Build and execute insert query
-            columns = [f'"{col}"' for col in normalized_data.keys()]
-            placeholders = ', '.join(['%s'] * len(normalized_data))
-            query = f'''
-                INSERT INTO public."KoboOptionUpdateTest" ({', '.join(columns)})
-                VALUES ({placeholders})
-            '''
-            cursor.execute(query, list(normalized_data.values()))
+            if conflict_column is None and keys:
+                column = NAME_KEY_COLUMN if NAME_KEY_COLUMN in schema.generated else NAME_KEY_EXPRESSION
+                with DB_QUERY_SECONDS.time(query="lookup_names"):
+                    cursor.execute(
+                        f'SELECT {column} FROM public."{REGISTRY_TABLE}" WHERE {column} = ANY(%s)',
+                        (list(keys),)
+                    )
+                    existing = {row[0] for row in cursor.fetchall()}
+                for columns, rows in groups.items():
+                    groups[columns] = [entry for entry in rows if entry[0] not in existing]
+
+            inserted = []
+            for columns, rows in groups.items():
+                if not rows:
+                    continue
+                with DB_QUERY_SECONDS.time(query="insert_batch"):
+                    result = execute_values(
+                        cursor,
+                        schema.bulk_insert_sql(columns, conflict_column),
+                        [values for _, values, _ in rows],
+                        page_size=page_size,
+                        fetch=True
+                    )
+                if conflict_column is None:
+                    inserted.extend(data for _, _, data in rows)
+                else:
+                    # Rows skipped by ON CONFLICT return nothing
+                    returned = {row[0] for row in result}
+                    inserted.extend(data for key, _, data in rows if key in returned)
+        with DB_QUERY_SECONDS.time(query="commit"):
             self.connection.commit()
-            return True
+
+        if _name_filter is not None:
+            for key in keys:
+                _name_filter.add(key)
+        return {"inserted": len(inserted), "skipped": total - len(inserted), "records": inserted}
+
+    @staticmethod
+    def _row_name_key(row: Dict) -> str:
+        return name_key(row.get('nombre') or '', row.get('apellido paterno') or '', row.get('apellido materno'))
 
     @staticmethod
     def _normalize_key(key: str) -> str:
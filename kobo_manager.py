@@ -1,21 +1,36 @@
-import requests
-from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Set, Tuple
+import hashlib
+import inspect
 import json
-import psycopg2
+import os
+import re
+import sys
 import uuid
-from utils import (
-    console,
-    display_header,
-    get_credentials,
-    save_credentials,
-    login_prompt
-)
+from urllib.parse import urlparse
+from services.export_service import MIRROR_FORMATS, ExportCheckpoint, SubmissionExporter, infer_format
+from services.version_store import VersionDiff, VersionStore
+from utils import normalize_label
+from utils.metrics import metrics
+from utils.text import normalize_labels
 
 
 def generate_kuid():
     return str(uuid.uuid4())[:8].lower()
 
+
+def choice_kuid(list_name: str, value: str, attempt: int = 0) -> str:
+    """Deterministic kuid for a choice: the same list and value give the same kuid
+
+    ``attempt`` derives an alternative when the first one is already taken
+    (see ChoiceCatalogue.new_kuid).
+    """
+    key = f"{list_name}\x1f{value}" + (f"\x1f{attempt}" if attempt else "")
+    return "k" + hashlib.blake2b(key.encode("utf-8"), digest_size=5).hexdigest()
+
+
 @dataclass
 class Choice:
     """Represents a form choice option for Kobo Toolbox surveys"""
@@ -26,7 +41,7 @@ class Choice:
     autovalue: str = None
 
     def __post_init__(self):
-        self.kuid = f"k{requests.utils.quote(self.value)[:7]}"
+        self.kuid = self.kuid or choice_kuid(self.list_name, self.value)
         self.autovalue = self.value
 
     def to_dict(self) -> Dict[str, Any]:
@@ -39,233 +54,702 @@ class Choice:
             "$autovalue": self.autovalue
         }
 
+class ChoiceColumns:
+    """Column-backed batch of new choices for one list
+
+    Values, labels and kuids are kept in parallel lists under a single
+    interned list_name instead of one dict per choice. API choice dicts are
+    only built while iterating, e.g. when the batch is added to a
+    ChoiceCatalogue. A missing kuid is assigned by the catalogue.
+    """
+    __slots__ = ("list_name", "values", "labels", "kuids")
+
+    def __init__(self, list_name: str):
+        self.list_name = sys.intern(list_name)
+        self.values: List[str] = []
+        self.labels: List[str] = []
+        self.kuids: List[Optional[str]] = []
+
+    @classmethod
+    def from_pairs(cls, list_name: str, pairs: Iterable[Tuple[str, str]]) -> "ChoiceColumns":
+        """Build from ``(value, label)`` pairs in one pass"""
+        columns = cls(list_name)
+        for value, label in pairs:
+            columns.values.append(value)
+            columns.labels.append(label)
+        columns.kuids = [None] * len(columns.values)
+        return columns
+
+    def append(self, value: str, label: str, kuid: Optional[str] = None):
+        self.values.append(value)
+        self.labels.append(label)
+        self.kuids.append(kuid)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        list_name = self.list_name
+        for value, label, kuid in zip(self.values, self.labels, self.kuids):
+            choice = {"name": value, "label": [label], "list_name": list_name, "$autovalue": value}
+            if kuid:
+                choice["$kuid"] = kuid
+            yield choice
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """API choice dicts for the whole batch"""
+        return list(self)
+
+
+class ChoiceCatalogue:
+    """Indexed view over an asset's ``content['choices']`` list
+
+    Wraps the list in place, so the asset document serialises exactly as
+    before; choices added through the catalogue are appended to it and
+    indexed by list_name, value and normalised label.
+
+    list_names are interned and an ``$autovalue`` equal to the value shares
+    its string, so large lists don't hold the same text many times. Every
+    choice gets a kuid that is unique within the form.
+    """
+
+    def __init__(self, choices: List[Dict[str, Any]]):
+        self._choices = choices
+        self._by_value: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._by_label: Dict[str, Dict[str, str]] = {}
+        self._kuids: Set[str] = set()
+        # Next suffix to try per (list_name, base value) in unique_value
+        self._suffixes: Dict[Tuple[str, str], int] = {}
+        # Set on every change; cleared by FormManager once pushed
+        self.dirty = False
+        keys = normalize_labels(self.label_of(choice) for choice in choices)
+        for choice, key in zip(choices, keys):
+            self._index(choice, key)
+
+    @staticmethod
+    def label_of(choice: Dict[str, Any]) -> str:
+        label = choice.get("label")
+        if isinstance(label, list):
+            label = label[0] if label else None
+        return label or ""
+
+    def _index(self, choice: Dict[str, Any], label_key: Optional[str] = None):
+        list_name = choice.get("list_name")
+        if isinstance(list_name, str):
+            list_name = choice["list_name"] = sys.intern(list_name)
+        if "$autovalue" in choice and choice["$autovalue"] == choice.get("name"):
+            choice["$autovalue"] = choice.get("name")
+        if choice.get("$kuid"):
+            self._kuids.add(choice["$kuid"])
+        self._by_value.setdefault(list_name, {}).setdefault(choice.get("name"), choice)
+        if label_key is None:
+            label_key = normalize_label(self.label_of(choice))
+        self._by_label.setdefault(list_name, {}).setdefault(label_key, choice.get("name"))
+
+    def __len__(self) -> int:
+        return len(self._choices)
+
+    def __contains__(self, list_name: str) -> bool:
+        return list_name in self._by_value
+
+    def lists(self) -> List[str]:
+        """Names of every choice list in the form"""
+        return list(self._by_value)
+
+    def choices(self, list_name: str) -> List[Dict[str, Any]]:
+        """Choices belonging to ``list_name``, in form order"""
+        return list(self._by_value.get(list_name, {}).values())
+
+    def has_value(self, list_name: str, value: str) -> bool:
+        return value in self._by_value.get(list_name, ())
+
+    def has_label(self, list_name: str, label: str) -> bool:
+        return normalize_label(label) in self._by_label.get(list_name, ())
+
+    def get(self, list_name: str, value: str) -> Optional[Dict[str, Any]]:
+        return self._by_value.get(list_name, {}).get(value)
+
+    def find_by_label(self, list_name: str, label: str) -> Optional[Dict[str, Any]]:
+        value = self._by_label.get(list_name, {}).get(normalize_label(label))
+        return None if value is None else self.get(list_name, value)
+
+    def unique_value(self, list_name: str, base_value: str, taken: Optional[Set[str]] = None) -> str:
+        """Return ``base_value`` or the first free ``base_value_N`` in the list
+
+        ``taken`` holds values reserved by the caller but not added yet.
+        """
+        taken = taken or set()
+
+        def is_free(value: str) -> bool:
+            return value not in taken and not self.has_value(list_name, value)
+
+        if is_free(base_value):
+            return base_value
+        key = (list_name, base_value)
+        counter = self._suffixes.get(key, 1)
+        while not is_free(f"{base_value}_{counter}"):
+            counter += 1
+        self._suffixes[key] = counter
+        return f"{base_value}_{counter}"
+
+    def new_kuid(self, list_name: str, value: str) -> str:
+        """Reserve the deterministic kuid for a choice, avoiding ones in use"""
+        attempt = 0
+        kuid = choice_kuid(list_name, value)
+        while kuid in self._kuids:
+            attempt += 1
+            kuid = choice_kuid(list_name, value, attempt)
+        self._kuids.add(kuid)
+        return kuid
+
+    def _append(self, choice: Dict[str, Any]) -> bool:
+        list_name, value = choice.get("list_name"), choice.get("name")
+        if self.has_value(list_name, value):
+            return False
+        kuid = choice.get("$kuid")
+        if not kuid or kuid in self._kuids:
+            choice["$kuid"] = self.new_kuid(list_name, value)
+        self._choices.append(choice)
+        self._index(choice)
+        return True
+
+    def add(self, choice: Dict[str, Any]) -> bool:
+        """Append a choice dict; returns False if its value is already in the list
+
+        A missing kuid, or one already used in the form, is replaced.
+        """
+        if not self._append(choice):
+            return False
+        self.dirty = True
+        return True
+
+    def add_many(self, choices: Iterable[Dict[str, Any]]) -> int:
+        """Append many choice dicts (or a ChoiceColumns); returns how many were new"""
+        added = sum(self._append(choice) for choice in choices)
+        if added:
+            self.dirty = True
+        return added
+
+    def remove(self, list_name: str, values: Set[str]) -> int:
+        """Drop choices of ``list_name`` whose value is in ``values``
+
+        The underlying list is filtered in place in a single pass.
+        """
+        removed = [v for v in values if self.has_value(list_name, v)]
+        if not removed:
+            return 0
+        self._choices[:] = [
+            c for c in self._choices
+            if c.get("list_name") != list_name or c.get("name") not in values
+        ]
+        self._by_value.pop(list_name, None)
+        self._by_label.pop(list_name, None)
+        for choice in self._choices:
+            if choice.get("list_name") == list_name:
+                self._index(choice)
+        self.dirty = True
+        return len(removed)
+
+    def set_label(self, list_name: str, value: str, label: str) -> bool:
+        """Replace the first (default language) label of a choice"""
+        choice = self.get(list_name, value)
+        if choice is None:
+            return False
+        labels = self._by_label[list_name]
+        old = normalize_label(self.label_of(choice))
+        if labels.get(old) == value:
+            del labels[old]
+        if isinstance(choice.get("label"), list) and choice["label"]:
+            choice["label"][0] = label
+        else:
+            choice["label"] = [label]
+        labels.setdefault(normalize_label(label), value)
+        self.dirty = True
+        return True
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """The underlying asset ``choices`` list"""
+        return self._choices
+
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+API_REQUEST_SECONDS = metrics.histogram(
+    "kobo_api_request_seconds",
+    "KoboToolbox API call latency including retries",
+    ("method", "endpoint", "status"),
+)
+API_RETRIES = metrics.counter(
+    "kobo_api_retries_total", "Retried KoboToolbox API attempts", ("method", "endpoint")
+)
+
+
+def endpoint_label(url: str) -> str:
+    """Low-cardinality endpoint name, e.g. ``/api/v2/assets/:uid/data.json``"""
+    return re.sub(r"/assets/[^/]+", "/assets/:uid", urlparse(url).path)
+
+
+@dataclass
+class RequestStats:
+    """Latency and retry counters shared by every call made through a client"""
+    requests: int = 0
+    retries: int = 0
+    failures: int = 0
+    total_latency: float = 0.0
+    last_latency: float = 0.0
+    max_latency: float = 0.0
+    _lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+
+    def record(self, latency: float, retries: int, failed: bool = False):
+        """Register a finished request (including all of its attempts)"""
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            self.failures += int(failed)
+            self.total_latency += latency
+            self.last_latency = latency
+            self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def avg_latency(self) -> float:
+        return self.total_latency / self.requests if self.requests else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Snapshot of the counters, e.g. for logging"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "total_latency": round(self.total_latency, 4),
+                "avg_latency": round(self.avg_latency, 4),
+                "max_latency": round(self.max_latency, 4),
+            }
+
+
+async def _anext(iterator):
+    return await iterator.__anext__()
+
+
 class KoboToolboxClient:
-    """Base client for Kobo Toolbox API interactions"""
-    def __init__(self, api_token: str, base_url: str = "https://eu.kobotoolbox.org/api/v2/"):
-        self.base_url = base_url.rstrip('/') + '/'
-        self.headers = {
-            "Authorization": f"Token {api_token}",
-            "Accept": "application/json"
-        }
+    """Synchronous client for Kobo Toolbox API interactions
+
+    A thin wrapper over kobo_manager_async.AsyncKoboToolboxClient (``pip
+    install httpx``): every call runs as a coroutine on an event loop in a
+    background thread and blocks until it is done, so connection pooling,
+    timeouts, retries on 429/5xx, rate limiting and metrics are the asyncio
+    client's. Other attributes (``stats``, ``base_url``, ...) are read from
+    and written to the wrapped client. Inside a running event loop use the
+    asyncio client instead; calls from there raise RuntimeError.
+    """
+    def __init__(self, api_token: str, pool_maxsize: int = 10, runner=None, **client_options):
+        from kobo_manager_async import EventLoopThread
+
+        client_options.setdefault("max_connections", pool_maxsize)
+        self._wrap(self._build_async(api_token, **client_options), runner or EventLoopThread(),
+                   owner=runner is None)
+
+    def _build_async(self, api_token: str, **client_options):
+        from kobo_manager_async import AsyncKoboToolboxClient
+        return AsyncKoboToolboxClient(api_token, **client_options)
+
+    def _wrap(self, wrapped, runner, owner: bool):
+        object.__setattr__(self, "_async", wrapped)
+        object.__setattr__(self, "_runner", runner)
+        # Only the owner closes the connections and the event loop
+        object.__setattr__(self, "_owner", owner)
+
+    def __getattr__(self, name):
+        wrapped = self.__dict__.get("_async")
+        if wrapped is None:
+            raise AttributeError(name)
+        value = getattr(wrapped, name)
+        if inspect.iscoroutinefunction(value) or inspect.isasyncgenfunction(value):
+            raise AttributeError(f"{type(self).__name__} has no synchronous '{name}'")
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._async, name, value)
+
+    def _run(self, coroutine):
+        return self._runner.run(coroutine)
+
+    def close(self):
+        """Release pooled connections"""
+        if self._owner and not self._runner.loop.is_closed():
+            self._run(self._async.aclose())
+            self._runner.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _request(self, method: str, endpoint: str, **kwargs):
+        """Send a request with timeout and bounded retry on transient failures"""
+        return self._run(self._async._request(method, endpoint, **kwargs))
 
-    def _get(self, endpoint: str) -> requests.Response: 
-        return requests.get(f"{self.base_url}{endpoint}", headers=self.headers)
+    def _get(self, endpoint: str, params: Optional[Dict] = None, **kwargs):
+        return self._run(self._async._get(endpoint, params=params, **kwargs))
 
-    def _patch(self, endpoint: str, data: Dict, use_json: bool = True) -> requests.Response:
+    def _patch(self, endpoint: str, data: Dict, use_json: bool = True, **kwargs):
         """Flexible PATCH method that handles both JSON and form data"""
-        url = f"{self.base_url}{endpoint.lstrip('/')}"
-        if use_json:
-            return requests.patch(url, headers=self.headers, json=data)
-        return requests.patch(url, headers=self.headers, data=data)
+        return self._run(self._async._patch(endpoint, data, use_json=use_json, **kwargs))
 
-class FormManager(KoboToolboxClient):
-    """Manages form configurations and updates for Kobo Toolbox surveys"""
-    def __init__(self, api_token: str, asset_uid: str):
-        super().__init__(api_token)
+
+class FormState:
+    """Asset document, choice catalogue and version bookkeeping of one form
+
+    Makes no API calls itself; AsyncFormManager (kobo_manager_async) adds
+    them, and FormManager is its synchronous wrapper.
+    """
+    def _init_form_state(self, asset_uid: str, snapshot_dir: Optional[str] = None,
+                         history: Optional[VersionStore] = None):
         self.asset_uid = asset_uid
         self.asset_data: Optional[Dict] = None
+        self.choices: Optional[ChoiceCatalogue] = None
         self.latest_version_id: Optional[str] = None
         self.deployed_version_id: Optional[str] = None
+        # Validators of the server document asset_data was loaded from
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._base_version_id: Optional[str] = None
+        # Content of every version seen, for diffs and restores
+        self.history = history
+        self.snapshot_path = Path(snapshot_dir) / f"{asset_uid}.json" if snapshot_dir else None
+        if self.snapshot_path:
+            self.load_snapshot()
 
-    def refresh_version_info(self):
-        """Update version information from API"""
-        response = self._get(f"assets/{self.asset_uid}/")
-        if response.status_code == 200:
-            data = response.json()
-            self.latest_version_id = data.get('version_id')
-            self.deployed_version_id = data.get('deployed_version_id')
-            return True
-        return False
-
-    def fetch_form_structure(self) -> bool:
-        """Retrieve current form structure from API"""
-        response = self._get(f"assets/{self.asset_uid}/")
-        if response.status_code == 200:
-            self.asset_data = response.json()
-            self.refresh_version_info()
-            return True
-        print(f"Failed to fetch form structure: {response.text}")
-        return False
+    def _set_asset(self, data: Dict, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Adopt ``data`` as the current server state of the asset"""
+        self.asset_data = data
+        content = self.asset_data.setdefault('content', {})
+        self.choices = ChoiceCatalogue(content.setdefault('choices', []))
+        self._apply_version_info(data)
+        # Server version the local changes are based on
+        self._base_version_id = data.get('version_id')
+        self._etag = etag
+        self._last_modified = last_modified
 
-    def add_choice(self, choice: Choice) -> bool:
-        """Add a new choice to the form structure"""
-        if not self.asset_data:
-            raise ValueError("Form structure not loaded - call fetch_form_structure first")
-        
-        try:
-            self.asset_data['content']['choices'].append(choice.to_dict())
-            return True
-        except KeyError as e:
-            print(f"Invalid form structure: {e}")
-            return False
+    def _apply_version_info(self, data: Dict):
+        self.latest_version_id = data.get('version_id', self.latest_version_id)
+        self.deployed_version_id = data.get('deployed_version_id', self.deployed_version_id)
 
-    def update_form(self) -> bool:
-        """Push updated form structure to Kobo Toolbox and get new version ID"""
-        if not self.asset_data:
-            return False
+    def _conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self._etag:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified:
+            headers["If-Modified-Since"] = self._last_modified
+        return headers
+
+    @property
+    def has_local_changes(self) -> bool:
+        """True if choices were changed since the last fetch or update"""
+        return self.choices is not None and self.choices.dirty
 
-        response = self._patch(f"assets/{self.asset_uid}/", self.asset_data)
-        if response.status_code != 200:
-            print(f"Form update failed: {response.text}")
+    def load_snapshot(self) -> bool:
+        """Load the on-disk asset snapshot, if there is one"""
+        if not self.snapshot_path or not self.snapshot_path.exists():
             return False
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        self._set_asset(snapshot["asset"], snapshot.get("etag"), snapshot.get("last_modified"))
+        # The form may be revalidated (304) from now on and never downloaded,
+        # so a history added after the snapshot starts from its content
+        self._record_version(self.asset_data['content'])
+        return True
+
+    def save_snapshot(self):
+        """Write the current asset and its validators to ``snapshot_path``"""
+        if not self.snapshot_path or self.asset_data is None:
+            return
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "etag": self._etag,
+                "last_modified": self._last_modified,
+                "asset": self.asset_data,
+            }, f, ensure_ascii=False)
+        os.replace(tmp, self.snapshot_path)
+
+    def _adopt_fetched(self, data: Dict, headers, conditional: bool):
+        """Take in a fetched asset (``conditional``: it was revalidated)"""
+        # Compared with the cached document, not latest_version_id: version
+        # info alone may have been refreshed since the content was fetched
+        cached = self.asset_data or {}
+        if conditional and data.get('version_id') == cached.get('version_id') \
+                and data.get('deployed_version_id') == cached.get('deployed_version_id'):
+            # Same version; keep the already indexed catalogue
+            self._etag = headers.get("ETag")
+            self._last_modified = headers.get("Last-Modified")
+        else:
+            self._set_asset(data, headers.get("ETag"), headers.get("Last-Modified"))
+        # No-op when this version is already stored
+        self._record_version(self.asset_data['content'])
+        self.save_snapshot()
 
-        self.latest_version_id = response.json().get('version_id')
+    def _adopt_update(self, data: Dict, headers, content: Optional[Dict] = None):
+        """Record the asset returned by a successful content PATCH of ``content``"""
+        self._apply_version_info(data)
+        if content is not None:
+            self._record_version(content)
+        self.asset_data['version_id'] = self._base_version_id = self.latest_version_id
+        self.asset_data['deployed_version_id'] = self.deployed_version_id
+        self._etag = headers.get("ETag")
+        self._last_modified = headers.get("Last-Modified")
+        self.choices.dirty = False
+        self.save_snapshot()
         print(f"Form updated successfully (New version: {self.latest_version_id})")
-        return self.refresh_version_info()
 
-    def redeploy_form(self, version_id: str = None) -> bool:
-        """Redeploy form with specific version (uses latest if not specified)"""
-        target_version = version_id or self.latest_version_id
-        if not target_version:
-            print("No version specified and no updates available")
+    def _record_version(self, content: Dict):
+        if self.history is not None and self.latest_version_id:
+            self.history.record(self.asset_uid, self.latest_version_id, content)
+
+    def can_restore(self, version_id: Optional[str]) -> bool:
+        """True if ``version_id`` is in the version history"""
+        return bool(version_id) and self.history is not None \
+            and self.history.has_version(self.asset_uid, version_id)
+
+    def _restore_content(self, version_id: str):
+        """Replace the local content with the stored ``version_id``; saved by the next update"""
+        content = self.history.load(self.asset_uid, version_id)
+        self.asset_data['content'] = content
+        self.choices = ChoiceCatalogue(content.setdefault('choices', []))
+        self.choices.dirty = True
+        print(f"Restored content of version {version_id}")
+
+    def version_diff(self, old_version: str, new_version: Optional[str] = None) -> VersionDiff:
+        """Survey, choice and settings changes between two stored versions
+
+        ``new_version`` defaults to the latest version.
+        """
+        if self.history is None:
+            raise ValueError("No version history configured")
+        return self.history.diff(self.asset_uid, old_version, new_version or self.latest_version_id)
+
+    def add_choice(self, choice: Choice) -> bool:
+        """Add a new choice to the form structure"""
+        if not self.asset_data:
+            raise ValueError("Form structure not loaded - call fetch_form_structure first")
+
+        if not self.choices.add(choice.to_dict()):
+            print(f"Value '{choice.value}' already exists in list '{choice.list_name}'")
             return False
+        return True
 
-        response = self._patch(
-            f"assets/{self.asset_uid}/deployment/",
-            {"version_id": target_version},
-            use_json=False  # Send as form data
-        )
-        
-        if response.status_code == 200:
-            print(f"Successfully redeployed version {target_version}")
-            self.deployed_version_id = target_version
-            input("Press Enter to continue...")
-            print("\033[2J")
-            return True
-            
-        print(f"Redeployment failed: {response.text}")
-        return False
+    @staticmethod
+    def _canonical_choice(choice: Dict[str, Any]) -> Dict[str, Any]:
+        """Choice without empty fields and with a list-valued label"""
+        if isinstance(choice.get("label"), list) and None not in choice.values():
+            # Already canonical (the usual case): send as is, no copy
+            return choice
+        canonical = {k: v for k, v in choice.items() if v is not None}
+        label = canonical.get("label")
+        if label is not None and not isinstance(label, list):
+            canonical["label"] = [label]
+        return canonical
+
+    def content_payload(self) -> Dict[str, Any]:
+        """Minimal PATCH body: the asset ``content`` with canonical choices"""
+        content = self.asset_data["content"]
+        return {"content": {
+            **content,
+            "choices": [self._canonical_choice(c) for c in content.get("choices", [])],
+        }}
 
     def needs_redeploy(self) -> bool:
         """Check if latest version is deployed"""
         return self.latest_version_id != self.deployed_version_id
 
+
+class FormManager(KoboToolboxClient):
+    """Manages form configurations and updates for Kobo Toolbox surveys
+
+    The last fetched asset is kept together with its ETag/Last-Modified
+    validators, so unchanged forms are revalidated instead of downloaded
+    again. With ``snapshot_dir`` the asset is also persisted to disk and
+    reloaded on start. With a ``history`` store the content of every version
+    seen is kept, so older versions can be diffed and restored offline.
+
+    Synchronous wrapper over kobo_manager_async.AsyncFormManager: the form
+    state (``asset_data``, ``choices``, version ids) and FormState helpers
+    such as ``add_choice`` are the wrapped manager's.
+    """
+    def __init__(self, api_token: str, asset_uid: str, snapshot_dir: Optional[str] = None,
+                 history: Optional[VersionStore] = None, **client_options):
+        super().__init__(api_token, asset_uid=asset_uid, snapshot_dir=snapshot_dir,
+                         history=history, **client_options)
+
+    def _build_async(self, api_token: str, **options):
+        from kobo_manager_async import AsyncFormManager
+        return AsyncFormManager(api_token, **options)
+
+    def sibling(self, asset_uid: str, snapshot_dir: Optional[str] = None) -> "FormManager":
+        """Manager for another asset on the same event loop, connections and limits
+
+        Siblings can be used from different threads; closing this manager
+        closes them too.
+        """
+        async def build():
+            # On the loop, where the shared semaphore has to be created
+            return self._async.sibling(asset_uid, snapshot_dir)
+
+        manager = FormManager.__new__(FormManager)
+        manager._wrap(self._run(build()), self._runner, owner=False)
+        return manager
+
+    def refresh_version_info(self) -> bool:
+        """Update version information from API
+
+        Answered from the cached asset when the server reports it unchanged.
+        A changed asset is adopted in full, like fetch_form_structure does,
+        unless there are local changes to push first.
+        """
+        return self._run(self._async.refresh_version_info())
+
+    def fetch_form_structure(self, force: bool = False) -> bool:
+        """Retrieve current form structure from API
+
+        A cached asset without local changes is revalidated with a
+        conditional request and reused if the server answers 304.
+        """
+        return self._run(self._async.fetch_form_structure(force))
+
+    def check_conflict(self) -> bool:
+        """True if the server's version moved since the asset was fetched"""
+        return self._run(self._async.check_conflict())
+
+    def update_form(self, force: bool = False, check_conflicts: bool = True) -> bool:
+        """Push updated form structure to Kobo Toolbox and get new version ID
+
+        Only the ``content`` document is sent, and nothing at all when no
+        choices changed since the last fetch (unless ``force``). The update
+        is refused if another client saved a new version in the meantime;
+        fetch again to merge, or pass ``check_conflicts=False`` to overwrite.
+        """
+        return self._run(self._async.update_form(force, check_conflicts))
+
+    def restore_version(self, version_id: str) -> bool:
+        """Save the stored content of ``version_id`` as a new version"""
+        return self._run(self._async.restore_version(version_id))
+
+    def redeploy_form(self, version_id: str = None) -> bool:
+        """Redeploy form with specific version (uses latest if not specified)
+
+        An older ``version_id`` held in the version history is restored
+        first (see restore_version) and the resulting new version deployed.
+        """
+        return self._run(self._async.redeploy_form(version_id))
+
     def update_and_redeploy(self, choice: Choice) -> bool:
         """Complete update cycle with validation"""
-        if not all([
-            self.fetch_form_structure(),
-            self.add_choice(choice),
-            self.update_form()
-        ]):
-            return False
+        return self._run(self._async.update_and_redeploy(choice))
 
-        if self.needs_redeploy():
-            return self.redeploy_form()
-        
-        print("Latest version already deployed")
-        return True
-    def export_data(self):
-        response = self._get(f"assets/{self.asset_uid}/data.json")
-        response = response.json()
-        response = response["results"]
-        with open("data.json", "w") as f:
-            json.dump(response, f, indent=4)
-    # Add this new method to your FormManager class
-    def autocreate_options_from_db(self, db_config, list_name):
-        """Auto-create form options from database entries using existing list_name"""
+    def iter_pages(self, query: Optional[Dict] = None, fields: Optional[List[str]] = None,
+                   page_size: int = 1000, prefetch: int = 4) -> Iterator[List[Dict]]:
+        """Yield pages of submissions in ``_id`` order
+
+        Up to ``prefetch`` pages keep downloading in the background while
+        the caller works on the current one (see AsyncFormManager.iter_pages).
+        """
+        pages = self._async.iter_pages(query, fields, page_size, prefetch)
         try:
-            connection = psycopg2.connect(**db_config)
-            cursor = connection.cursor()
-            
-            # Get existing choices for the specified list
-            existing_choices = [
-                c for c in self.asset_data["content"]["choices"] 
-                if c['list_name'] == list_name
-            ]
-            
-            # Create a set of existing labels for comparison
-            existing_labels = {
-                c['label'][0].lower().strip()  # Normalize for comparison
-                for c in existing_choices
-            }
-            
-            # Get all names from database
-            cursor.execute('''
-                SELECT nombre, "apellido paterno", "apellido materno" 
-                FROM public."KoboOptionUpdateTest"
-            ''')
-            rows = cursor.fetchall()
-            
-            # Prepare new choices
-            new_choices = []
-            for nombre, paterno, materno in rows:
-                # Generate full label
-                full_label = f"{nombre} {paterno} {materno or ''}".strip()
-                normalized_label = full_label.lower()  # Normalize for comparison
-                
-                # Skip if label already exists
-                if normalized_label in existing_labels:
-                    continue
-                
-                # Generate base value
-                base_value = "_".join([
-                    nombre.lower().replace(" ", "_"),
-                    paterno.lower().replace(" ", "_"),
-                    (materno or "").lower().replace(" ", "_")
-                ]).strip("_")
-                
-                # Handle duplicates within the same list
-                # Store existing values once in a set
-                existing_values = {c['name'] for c in existing_choices}  
-
-                counter = 1
-                value = base_value
-
-                # Ensure the value is unique
-                while value in existing_values:
-
-                    value = f"{base_value}_{counter}"
-                    counter += 1
-                    
-                    # Safety limit to prevent infinite loop
-                    if counter > 10:  # Adjust the limit if necessary
-                        console.print("[bold red]Error: Too many duplicates, stopping to prevent infinite loop.[/]", style="error")
-                        return 0  # Or raise an exception
-
-                # Add the final unique value to the set to prevent further conflicts
-                existing_values.add(value)
-
-                    
-                # Create new choice
-                new_choice = {
-                    'list_name': list_name,
-                    'name': value,
-                    'label': [full_label],  # Array format
-                    '$kuid': generate_kuid(),
-                    '$autovalue': value
-                }
-                
-                new_choices.append(new_choice)
-                existing_labels.add(normalized_label)  # Add to existing labels
-            
-            # Show preview of new choices
-            if new_choices:
-                console.print("\n[bold]New options to be added:[/]")
-                for choice in new_choices:
-                    console.print(f"- {choice['label'][0]} → {choice['name']}")
-                
-                if console.input("\n[prompt]Add these options? (Y/n):[/] ").lower() != 'y':
-                    console.print("Operation cancelled", style="warning")
-                    return 0
-                
-                # Add new choices to form
-                self.asset_data["content"]["choices"].extend(new_choices)
-                
-                # Ensure form updates before redeployment
-                if not self.update_form():  # <-- Ensure new choices are registered
-                    console.print("[bold red]Form update failed. Fix errors before redeploying.[/]", style="error")
-                    return 0
-                
-                self.refresh_version_info()  # <-- Ensure latest version is known
-                self.needs_redeploy = True
-                return len(new_choices)
-            
-            console.print("No new options to add", style="warning")
-            return 0
-            
+            while True:
+                try:
+                    yield self._run(_anext(pages))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(pages.aclose())
+
+    def iter_submissions(self, query: Optional[Dict] = None, **page_options) -> Iterator[Dict]:
+        for page in self.iter_pages(query, **page_options):
+            yield from page
+
+    def export_data(self, path: str = "data.ndjson", fmt: Optional[str] = None,
+                    resume: bool = True, page_size: int = 1000, incremental: bool = False,
+                    reconcile_interval: Optional[float] = None, **sink_options) -> int:
+        """Stream all submissions to ``path`` (NDJSON, CSV, Parquet, SQLite or DuckDB)
+
+        Pages are followed until the API runs out of ``next`` links. An
+        interrupted export resumes from its checkpoint file unless ``resume``
+        is False. With ``incremental`` only submissions newer than the last
+        run are appended; if ``reconcile_interval`` (seconds) has passed since
+        the last full export, a full re-export replaces the file instead so
+        edits and deletions are picked up. Returns the number of submissions
+        written in this run.
+
+        SQLite (``.sqlite``/``.db``) and DuckDB (``.duckdb``) outputs are a
+        queryable mirror with tables derived from the form's survey (see
+        services.submission_mirror); ``indexes`` picks the indexed columns.
+        """
+        fmt = fmt or infer_format(path)
+        if fmt in MIRROR_FORMATS and "survey" not in sink_options:
+            if self.asset_data is None and not self.fetch_form_structure():
+                raise RuntimeError("Form structure is needed to build the submission mirror")
+            sink_options["survey"] = self.asset_data.get("content", {}).get("survey", [])
+        exporter = SubmissionExporter(self, page_size=page_size)
+        if incremental and reconcile_interval is not None:
+            checkpoint = ExportCheckpoint.for_output(path)
+            if checkpoint.reconcile_due(reconcile_interval):
+                return exporter.reconcile(path, fmt=fmt, **sink_options)
+        return exporter.export(path, fmt=fmt, resume=resume, incremental=incremental, **sink_options)
+
+    def autocreate_options_from_db(self, db_config, list_name, confirm: bool = True,
+                                   remove_missing: bool = False, update_labels: bool = False,
+                                   batch_size: int = 5000, check_similar: bool = False):
+        """Auto-create form options from database entries using existing list_name
+
+        The registry is diffed against the list in one pass and applied as a
+        single form update. Pass ``confirm=False`` to skip the preview prompt
+        (e.g. from cron). ``check_similar`` warns about new options that look
+        like a near-duplicate of another one. Returns the number of options
+        added.
+        """
+        import psycopg2
+        from services.option_sync_service import OptionSyncEngine
+        from utils import console
+
+        engine = OptionSyncEngine(self, db_config, list_name, batch_size=batch_size)
+        try:
+            diff = engine.compute_diff(remove_missing=remove_missing, update_labels=update_labels,
+                                       check_similar=check_similar)
         except psycopg2.Error as e:
             console.print(f"Database error: {e}", style="error")
             return 0
-        finally:
-            if connection:
-                connection.close()
+
+        if not diff:
+            console.print("No new options to add", style="warning")
+            return 0
+
+        # Show preview of changes
+        if confirm:
+            if diff.added:
+                console.print("\n[bold]New options to be added:[/]")
+                for choice in diff.added:
+                    console.print(f"- {choice['label'][0]} → {choice['name']}")
+            if diff.removed:
+                console.print("\n[bold]Options to be removed:[/]")
+                for choice in diff.removed:
+                    console.print(f"- {self.choices.label_of(choice)} → {choice['name']}")
+            if diff.relabelled:
+                console.print("\n[bold]Options to be relabelled:[/]")
+                for value, label in diff.relabelled:
+                    console.print(f"- {value} → {label}")
+            if diff.similar:
+                console.print("\n[bold]Possible duplicates (added anyway):[/]")
+                for label, other, kind in diff.similar:
+                    console.print(f"- {label} ~ {other} ({kind.replace('_', ' ')})", style="warning")
+
+            if console.input("\n[prompt]Apply these changes? (Y/n):[/] ").lower() != 'y':
+                console.print("Operation cancelled", style="warning")
+                return 0
+
+        if not engine.apply(diff):
+            console.print("[bold red]Form update failed. Fix errors before redeploying.[/]", style="error")
+            return 0
+
+        return len(diff.added)
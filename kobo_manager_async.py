@@ -0,0 +1,407 @@
+"""asyncio Kobo Toolbox client and form manager
+
+Requests run concurrently on one pooled ``httpx.AsyncClient`` (``pip install
+httpx``), bounded by a semaphore and an optional token-bucket rate limiter.
+The form state (asset cache, choice catalogue, snapshots) is FormState.
+KoboToolboxClient and FormManager in kobo_manager are synchronous wrappers
+that run these coroutines on an EventLoopThread.
+"""
+import asyncio
+import json
+import math
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from kobo_manager import (
+    API_REQUEST_SECONDS,
+    API_RETRIES,
+    RETRY_STATUS_CODES,
+    Choice,
+    FormState,
+    RequestStats,
+    endpoint_label,
+)
+from services.version_store import VersionStore
+
+
+class AsyncRateLimiter:
+    """Token bucket for coroutines: ``rate`` requests per second, bursts up to ``burst``"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        # Created on first use so it binds to the running loop
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self):
+        """Wait until a request may be sent; waiters are served in order"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class EventLoopThread:
+    """Event loop running in a daemon thread, for calling coroutines from sync code
+
+    ``run`` may be called from any thread except one that is already running
+    an event loop; blocking there would stall that loop, so it raises.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="kobo-event-loop",
+                                        daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine):
+        """Run ``coroutine`` on the loop and return its result"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+        coroutine.close()
+        raise RuntimeError("The synchronous Kobo client can't be called inside a running event loop; "
+                           "use kobo_manager_async.AsyncFormManager instead")
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class AsyncKoboToolboxClient:
+    """asyncio client for Kobo Toolbox API interactions
+
+    Calls share one ``httpx.AsyncClient`` connection pool; at most
+    ``max_concurrency`` requests are in flight at once. Pass ``client``,
+    ``semaphore`` and ``rate_limiter`` to share them between several
+    clients, as AsyncFormManager.sibling does.
+    """
+    def __init__(
+        self,
+        api_token: str,
+        base_url: str = "https://eu.kobotoolbox.org/api/v2/",
+        client=None,
+        timeout: Union[float, Tuple[float, float]] = (5.0, 60.0),
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 30.0,
+        max_connections: int = 10,
+        max_concurrency: Optional[int] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        rate_limiter: Optional[AsyncRateLimiter] = None,
+    ):
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("The asyncio client requires httpx: pip install httpx") from e
+        self._httpx = httpx
+        self.base_url = base_url.rstrip('/') + '/'
+        self.headers = {
+            "Authorization": f"Token {api_token}",
+            "Accept": "application/json"
+        }
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.client = client or self._build_client(max_connections, timeout)
+        self.max_concurrency = max_concurrency or max_connections
+        self._semaphore = semaphore
+        self.rate_limiter = rate_limiter
+        self.stats = RequestStats()
+
+    @staticmethod
+    def _build_client(max_connections: int, timeout: Union[float, Tuple[float, float]] = (5.0, 60.0)):
+        """Create a keep-alive AsyncClient with ``max_connections`` pooled connections"""
+        import httpx
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = httpx.Timeout(read, connect=connect)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        return httpx.AsyncClient(timeout=timeout, limits=limits)
+
+    async def aclose(self):
+        """Release pooled connections"""
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    def _url(self, endpoint: str) -> str:
+        if endpoint.startswith(("http://", "https://")):
+            return endpoint
+        return f"{self.base_url}{endpoint.lstrip('/')}"
+
+    def _retry_delay(self, attempt: int, response=None) -> float:
+        """Seconds to wait before the next attempt, honouring Retry-After"""
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0.0), self.max_backoff)
+        return min(self.backoff_factor * (2 ** attempt), self.max_backoff)
+
+    def _record(self, method: str, endpoint_name: str, status, started: float, retries: int,
+                failed: bool = True):
+        latency = time.perf_counter() - started
+        self.stats.record(latency, retries, failed=failed)
+        API_REQUEST_SECONDS.observe(latency, method=method, endpoint=endpoint_name, status=status)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily: before Python 3.10 it binds to the loop current at creation
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _request(self, method: str, endpoint: str, **kwargs):
+        """Send a request with timeout and bounded retry on transient failures"""
+        httpx = self._httpx
+        url = self._url(endpoint)
+        headers = {**self.headers, **kwargs.pop("headers", {})}
+        # Read timeouts are only retried for GET: a PATCH may already have been applied
+        retryable_errors = (
+            (httpx.NetworkError, httpx.TimeoutException, httpx.RemoteProtocolError)
+            if method == "GET" else (httpx.ConnectError, httpx.ConnectTimeout)
+        )
+
+        endpoint_name = endpoint_label(url)
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                async with self.semaphore:
+                    if self.rate_limiter is not None:
+                        await self.rate_limiter.acquire()
+                    response = await self.client.request(method, url, headers=headers, **kwargs)
+            except retryable_errors:
+                if attempt >= self.max_retries:
+                    self._record(method, endpoint_name, "error", started, attempt)
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt))
+                attempt += 1
+                API_RETRIES.inc(method=method, endpoint=endpoint_name)
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                await asyncio.sleep(self._retry_delay(attempt, response))
+                attempt += 1
+                API_RETRIES.inc(method=method, endpoint=endpoint_name)
+                continue
+
+            self._record(method, endpoint_name, response.status_code, started, attempt,
+                         failed=response.status_code >= 400)
+            return response
+
+    async def _get(self, endpoint: str, params: Optional[Dict] = None, **kwargs):
+        return await self._request("GET", endpoint, params=params, **kwargs)
+
+    async def _patch(self, endpoint: str, data: Dict, use_json: bool = True, **kwargs):
+        """Flexible PATCH method that handles both JSON and form data"""
+        if use_json:
+            return await self._request("PATCH", endpoint, json=data, **kwargs)
+        return await self._request("PATCH", endpoint, data=data, **kwargs)
+
+
+class AsyncFormManager(AsyncKoboToolboxClient, FormState):
+    """asyncio form manager; kobo_manager.FormManager is its synchronous wrapper
+
+    Asset caching, conflict checks and snapshots; every API call is a
+    coroutine. Data pages are fetched several at a time, and
+    managers created with ``sibling`` share one connection pool, semaphore
+    and rate limiter, so many assets can be processed with asyncio.gather.
+    """
+    def __init__(self, api_token: str, asset_uid: str, snapshot_dir: Optional[str] = None,
+                 history: Optional[VersionStore] = None, **client_options):
+        super().__init__(api_token, **client_options)
+        self._init_form_state(asset_uid, snapshot_dir, history)
+        self._api_token = api_token
+        self._client_options = client_options
+
+    def sibling(self, asset_uid: str, snapshot_dir: Optional[str] = None) -> "AsyncFormManager":
+        """Manager for another asset on the same connections and limits"""
+        options = {**self._client_options, "client": self.client,
+                   "semaphore": self.semaphore, "rate_limiter": self.rate_limiter}
+        manager = AsyncFormManager(self._api_token, asset_uid, snapshot_dir, self.history, **options)
+        manager.stats = self.stats
+        return manager
+
+    async def refresh_version_info(self):
+        """Update version information from API
+
+        Answered from the cached asset when the server reports it unchanged.
+        """
+        response = await self._get(f"assets/{self.asset_uid}/", headers=self._conditional_headers())
+        if response.status_code == 304:
+            return True
+        if response.status_code == 200:
+            if self.has_local_changes:
+                # Keep the validators of the content the changes are based
+                # on, so check_conflict still sees the new version
+                self._apply_version_info(response.json())
+            else:
+                self._adopt_fetched(response.json(), response.headers, self.asset_data is not None)
+            return True
+        return False
+
+    async def fetch_form_structure(self, force: bool = False) -> bool:
+        """Retrieve current form structure from API (see FormManager)"""
+        conditional = not force and self.asset_data is not None and not self.has_local_changes
+        response = await self._get(
+            f"assets/{self.asset_uid}/",
+            headers=self._conditional_headers() if conditional else {}
+        )
+        if response.status_code == 304:
+            return True
+        if response.status_code == 200:
+            self._adopt_fetched(response.json(), response.headers, conditional)
+            return True
+        print(f"Failed to fetch form structure: {response.text}")
+        return False
+
+    async def check_conflict(self) -> bool:
+        """True if the server's version moved since the asset was fetched"""
+        response = await self._get(f"assets/{self.asset_uid}/", headers=self._conditional_headers())
+        if response.status_code == 304:
+            return False
+        if response.status_code != 200:
+            raise RuntimeError(f"Version check failed: {response.status_code} {response.text}")
+        return response.json().get('version_id') != self._base_version_id
+
+    async def update_form(self, force: bool = False, check_conflicts: bool = True) -> bool:
+        """Push the form content and record the new version (see FormManager)"""
+        if not self.asset_data:
+            return False
+        if not force and not self.has_local_changes:
+            print("No changes to update")
+            return True
+        if check_conflicts and self._base_version_id and await self.check_conflict():
+            print("Form update refused: the form was changed on the server since it was fetched")
+            return False
+
+        payload = self.content_payload()
+        response = await self._patch(f"assets/{self.asset_uid}/", payload)
+        if response.status_code != 200:
+            print(f"Form update failed: {response.text}")
+            return False
+
+        self._adopt_update(response.json(), response.headers, payload["content"])
+        return True
+
+    async def restore_version(self, version_id: str) -> bool:
+        """Save the stored content of ``version_id`` as a new version"""
+        if self.asset_data is None and not await self.fetch_form_structure():
+            return False
+        self._restore_content(version_id)
+        return await self.update_form()
+
+    async def redeploy_form(self, version_id: str = None) -> bool:
+        """Redeploy form with specific version (see FormManager.redeploy_form)"""
+        if version_id and version_id != self.latest_version_id and self.can_restore(version_id):
+            if not await self.restore_version(version_id):
+                return False
+            version_id = None
+        target_version = version_id or self.latest_version_id
+        if not target_version:
+            print("No version specified and no updates available")
+            return False
+
+        response = await self._patch(
+            f"assets/{self.asset_uid}/deployment/",
+            {"version_id": target_version},
+            use_json=False  # Send as form data
+        )
+        if response.status_code == 200:
+            print(f"Successfully redeployed version {target_version}")
+            self.deployed_version_id = target_version
+            return True
+
+        print(f"Redeployment failed: {response.text}")
+        return False
+
+    async def update_and_redeploy(self, choice: Choice) -> bool:
+        """Complete update cycle with validation"""
+        if not await self.fetch_form_structure() or not self.add_choice(choice) \
+                or not await self.update_form():
+            return False
+        if self.needs_redeploy():
+            return await self.redeploy_form()
+        print("Latest version already deployed")
+        return True
+
+    async def _data_page(self, params: Optional[Dict], endpoint: Optional[str] = None) -> Dict[str, Any]:
+        response = await self._get(endpoint or f"assets/{self.asset_uid}/data.json", params=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"Data export failed: {response.status_code} {response.text}")
+        return response.json()
+
+    async def iter_pages(self, query: Optional[Dict] = None, fields: Optional[List[str]] = None,
+                         page_size: int = 1000, prefetch: int = 4) -> AsyncIterator[List[Dict]]:
+        """Yield pages of submissions in ``_id`` order
+
+        The first page reports the total ``count``; the remaining pages are
+        then requested by offset, up to ``prefetch`` at a time, and yielded
+        in order. Without a count the ``next`` links are followed one by one.
+        """
+        params = {"limit": page_size, "sort": json.dumps({"_id": 1})}
+        if query:
+            params["query"] = json.dumps(query)
+        if fields:
+            params["fields"] = json.dumps(fields)
+
+        page = await self._data_page(params)
+        results = page.get("results", [])
+        if results:
+            yield results
+        count = page.get("count")
+        if count is None:
+            while page.get("next"):
+                page = await self._data_page(None, page["next"])
+                if page.get("results"):
+                    yield page["results"]
+            return
+
+        offsets = [page_size * n for n in range(1, math.ceil(count / page_size))]
+        pending: List[asyncio.Task] = []
+        try:
+            for offset in offsets:
+                pending.append(asyncio.ensure_future(self._data_page({**params, "start": offset})))
+                if len(pending) >= prefetch:
+                    results = (await pending.pop(0)).get("results", [])
+                    if results:
+                        yield results
+            while pending:
+                results = (await pending.pop(0)).get("results", [])
+                if results:
+                    yield results
+        finally:
+            # The consumer stopped early or a page failed: drop the prefetches
+            for task in pending:
+                task.cancel()
+
+    async def iter_submissions(self, query: Optional[Dict] = None, **page_options) -> AsyncIterator[Dict]:
+        async for page in self.iter_pages(query, **page_options):
+            for submission in page:
+                yield submission
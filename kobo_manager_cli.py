@@ -1,28 +1,33 @@
+import argparse
+import json
 import sys
-from rich.panel import Panel
+from contextlib import redirect_stdout
 import kobo_manager
 import os
-from time import sleep
-from listener.webhook_listener import WebhookListener
+from time import sleep, perf_counter
+from services.export_service import MIRROR_FORMATS, infer_format
+from services.version_store import VersionStore
 import signal
 
 
-from utils import (
-    console,
-    display_header,
-    get_credentials,
-    save_credentials,
-    login_prompt
-)
-
 def handle_interrupt(signum, frame):
     """Handle CTRL+C gracefully"""
     sys.exit(0)  # Will trigger finally block
 
 signal.signal(signal.SIGINT, handle_interrupt)
 
+# Exit codes of the non-interactive commands
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
 
 def main():
+    # rich is only needed by the interactive menu, not by the commands
+    from rich.panel import Panel
+    from utils import console, display_header, get_credentials
+
     display_header()
     listener = None  # Regular variable in main scope
     
@@ -47,7 +52,9 @@ def main():
         with console.status("[bold green]Connecting to KoboToolbox..."):
             form_manager = kobo_manager.FormManager(
                 api_token=api_token,
-                asset_uid=asset_uid
+                asset_uid=asset_uid,
+                snapshot_dir=os.getenv("KOBO_SNAPSHOT_DIR"),
+                history=VersionStore.in_dir(os.getenv("KOBO_HISTORY_DIR")) if os.getenv("KOBO_HISTORY_DIR") else None
             )
         console.print(Panel(
             f"Connected to project: [bold]{asset_uid}[/]",
@@ -73,9 +80,24 @@ def main():
 
             if choice == "ED":
                 console.print("\nExport Data selected", style="info")
-                console.print("Exporting data...")
-                form_manager.export_data()
-                console.print("Data exported successfully", style="success")
+                export_path = console.input("[prompt]Output file (.ndjson/.csv/.parquet/.sqlite/.duckdb) [data.ndjson]: ") or "data.ndjson"
+                options = {}
+                if infer_format(export_path) in MIRROR_FORMATS:
+                    # A mirror is refreshed in place unless a full rebuild is asked for
+                    incremental = console.input("[prompt]Refresh with new submissions only? (Y/n): ").lower() != 'n'
+                    indexes = os.getenv("KOBO_MIRROR_INDEXES")
+                    if indexes:
+                        options["indexes"] = [i.strip() for i in indexes.split(",") if i.strip()]
+                else:
+                    incremental = console.input("[prompt]Only append new submissions? (y/N): ").lower() == 'y'
+                try:
+                    with console.status("[bold green]Exporting data..."):
+                        exported = form_manager.export_data(export_path, incremental=incremental, **options)
+                except (RuntimeError, ValueError, OSError) as e:
+                    # Failed pages, bad mirror indexes, network errors; the checkpoint allows resuming
+                    console.print(f"Export failed: {e}", style="error")
+                    continue
+                console.print(f"{exported} submissions exported to {export_path}", style="success")
 
             if choice == "AC":
                 console.print("\nAdd Choices selected", style="info")
@@ -85,6 +107,10 @@ def main():
                 list_name = console.input("[prompt]Enter the list name for the new choice: ")
                 choice_label = console.input("[prompt]Enter the new choice label (the one will be shown in the fomr): ")
                 choice_value = console.input("[prompt]Enter the new choice value (the one stored in kobo's database): ")
+                if form_manager.choices.has_value(list_name, choice_value):
+                    suggested = form_manager.choices.unique_value(list_name, choice_value)
+                    console.print(f"Value '{choice_value}' is already used in '{list_name}', using '{suggested}'", style="warning")
+                    choice_value = suggested
                 console.print("Review the new choice:", style="warning")
                 console.print(f"List name: {list_name}\nLabel: {choice_label}\nValue: {choice_value}")
                 if console.input("[prompt]Add this choice? (Y/n): ").lower() == 'y':
@@ -99,12 +125,30 @@ def main():
 
             if choice == "UR":
                 console.print("\nUpdate and Redeploy selected", style="warning")
-                if form_manager.needs_redeploy is False:
+                if form_manager.history is not None:
+                    versions = [v for v, _ in form_manager.history.versions(asset_uid)]
+                    version_id = console.input(f"[prompt]Version to deploy (stored: {', '.join(versions[-5:])}) [latest]: ")
+                    if version_id and version_id != form_manager.latest_version_id:
+                        if not form_manager.can_restore(version_id):
+                            console.print(f"Version {version_id} is not in the local history", style="error")
+                            continue
+                        if form_manager.can_restore(form_manager.latest_version_id):
+                            console.print(form_manager.version_diff(form_manager.latest_version_id, version_id).summary())
+                        else:
+                            console.print("The current version isn't in the history yet, no diff to show", style="warning")
+                        if console.input("[prompt]Restore and deploy this version? (y/N): ").lower() == 'y':
+                            form_manager.redeploy_form(version_id)
+                        continue
+                if not form_manager.needs_redeploy():
                     console.print("No changes to deploy", style="warning")
                     continue
                 form_manager.redeploy_form()
+                input("Press Enter to continue...")
+                print("\033[2J")
 
             if choice == 'A':
+                # Flask, psycopg2 and the listener are only needed here
+                from listener.webhook_listener import WebhookListener
                 try:
                     listener = WebhookListener()
                     console.print("Starting listener...", style="info")
@@ -120,7 +164,7 @@ def main():
                 
                 # Get existing list names from the form
                 form_manager.fetch_form_structure()
-                existing_lists = {c['list_name'] for c in form_manager.asset_data["content"]["choices"]}
+                existing_lists = form_manager.choices.lists()
                 
                 # Prompt user to select list name
                 list_name = console.input(
@@ -133,17 +177,12 @@ def main():
                         continue
                         
                 # Database configuration
-                db_config = {
-                    'host': os.getenv("SUPABASE_HOST"),
-                    'port': os.getenv("SUPABASE_PORT", 5432),
-                    'database': os.getenv("SUPABASE_DB"),
-                    'user': os.getenv("SUPABASE_USER"),
-                    'password': os.getenv("SUPABASE_PASSWORD")
-                }
+                from database.supabase_client import db_config_from_env
+                db_config = db_config_from_env()
                 
                 try:
                     console.print("[bold green]Generating options from database...")
-                    count = form_manager.autocreate_options_from_db(db_config, list_name)
+                    count = form_manager.autocreate_options_from_db(db_config, list_name, check_similar=True)
                         
                     if count > 0 and console.input("[prompt]Update and redeploy form? (Y/n): ").lower() == 'y':
                         form_manager.update_form()
@@ -178,10 +217,166 @@ def main():
         console.input("[prompt]Press Enter to exit...[/]")
         sys.exit(1)
 
+def command_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="KoboToolbox form manager. Without a command the interactive menu starts; "
+                    "commands print a JSON result and exit 0 on success, 1 on failure, "
+                    "2 on usage or configuration errors."
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    asset = argparse.ArgumentParser(add_help=False)
+    asset.add_argument("--asset-uid", help="project to work on (default: ASSET_UID)")
+    client = argparse.ArgumentParser(add_help=False)
+    client.add_argument("--base-url", default=os.getenv("KOBO_BASE_URL"),
+                        help="KoboToolbox API root (default: KOBO_BASE_URL or the EU server)")
+
+    export = commands.add_parser("export", parents=[asset, client], help="export submissions")
+    export.add_argument("output", help=".ndjson, .csv, .parquet, .sqlite or .duckdb file")
+    export.add_argument("--format", help="override the format inferred from the file name")
+    export.add_argument("--incremental", action="store_true", help="only add new submissions")
+    export.add_argument("--page-size", type=int, default=1000)
+    export.add_argument("--reconcile-interval", type=float,
+                        help="seconds after which an incremental run re-exports everything")
+    export.add_argument("--index", dest="indexes", action="append",
+                        help="mirror column to index (repeatable)")
+
+    sync = commands.add_parser("sync-options", parents=[asset, client],
+                               help="sync a choice list with the registry database")
+    sync.add_argument("list_name")
+    sync.add_argument("--remove-missing", action="store_true")
+    sync.add_argument("--update-labels", action="store_true")
+    sync.add_argument("--max-changes", type=int, help="fail instead of applying more changes")
+
+    add = commands.add_parser("add-choices", parents=[asset, client],
+                              help="add choices from a CSV or JSON file")
+    add.add_argument("file", help="rows with list_name, value and label")
+    add.add_argument("--list-name", help="list for rows without a list_name")
+
+    for command in (sync, add):
+        command.add_argument("--no-redeploy", dest="redeploy", action="store_false")
+        command.add_argument("--dry-run", action="store_true", help="report the changes only")
+
+    redeploy = commands.add_parser("redeploy", parents=[asset, client],
+                                   help="deploy the latest or a stored version")
+    redeploy.add_argument("--version-id", help="version to deploy (restored from KOBO_HISTORY_DIR if older)")
+
+    listen = commands.add_parser("listen", help="run the webhook listener until SIGINT/SIGTERM")
+    listen.add_argument("--host")
+    listen.add_argument("--port", type=int)
+    listen.add_argument("--async-ingest", action="store_true", default=None)
+    listen.add_argument("--no-tunnel", dest="tunnel", action="store_false", default=None)
+
+    batch = commands.add_parser("batch", parents=[client], help="run a JSON manifest of jobs in parallel")
+    batch.add_argument("manifest")
+    batch.add_argument("--workers", type=int, help="assets processed at once (default 4)")
+    batch.add_argument("--requests-per-second", type=float, help="API rate limit (default 5)")
+    batch.add_argument("--timeout", type=float, help="skip jobs not started after this many seconds")
+    batch.add_argument("--continue-on-error", action="store_true",
+                       help="keep running an asset's jobs after one fails")
+    return parser
+
+
+def _command_credentials() -> tuple:
+    """API token and default asset for commands: environment first, then keyring"""
+    api_token = os.getenv("KOBO_API_TOKEN")
+    asset_uid = os.getenv("ASSET_UID")
+    if not api_token:
+        from utils import get_credentials
+        stored = get_credentials()
+        if stored:
+            api_token, asset_uid = stored[0], asset_uid or stored[1]
+    if not api_token:
+        raise ValueError("No API token: set KOBO_API_TOKEN or store credentials from the interactive menu")
+    return api_token, asset_uid
+
+
+def _job_runner(args, api_token: str, **options):
+    from services.job_service import JobRunner
+
+    history_dir = os.getenv("KOBO_HISTORY_DIR")
+    if args.base_url:
+        options["base_url"] = args.base_url
+    return JobRunner(
+        api_token,
+        snapshot_dir=os.getenv("KOBO_SNAPSHOT_DIR"),
+        history=VersionStore.in_dir(history_dir) if history_dir else None,
+        **options
+    )
+
+
+def _run_listener(args) -> dict:
+    from listener.webhook_listener import WebhookListener
+
+    started = perf_counter()
+    listener = WebhookListener(async_ingest=args.async_ingest, host=args.host, port=args.port,
+                               tunnel=args.tunnel)
+    # Blocks until SIGINT/SIGTERM, then drains in-flight requests
+    listener.serve_forever()
+    return {"command": "listen", "ok": True, "duration": round(perf_counter() - started, 3)}
+
+
+def _run_batch(args, api_token: str) -> dict:
+    from services.job_service import load_manifest
+
+    manifest = load_manifest(args.manifest)
+    runner = _job_runner(
+        args, api_token,
+        max_workers=args.workers or manifest["workers"] or 4,
+        requests_per_second=args.requests_per_second or manifest["requests_per_second"] or 5.0,
+        timeout=args.timeout or manifest["timeout"],
+        stop_on_error=not args.continue_on_error,
+    )
+    with runner:
+        return runner.run(manifest["jobs"]).as_dict()
+
+
+def _run_single(args, api_token: str, asset_uid: str) -> dict:
+    from services.job_service import Job
+
+    options = {key: value for key, value in vars(args).items()
+               if key not in ("command", "asset_uid", "base_url")}
+    job = Job(args.command, args.asset_uid or asset_uid, options)
+    job.validate()
+    with _job_runner(args, api_token, max_workers=1) as runner:
+        return runner.run([job]).results[0].as_dict()
+
+
+def run_command(argv) -> int:
+    """Run one non-interactive command and print its result as JSON
+
+    Progress messages go to stderr so stdout only carries the result.
+    """
+    args = command_parser().parse_args(argv)
+    out = sys.stdout
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        with redirect_stdout(sys.stderr):
+            if args.command == "listen":
+                result = _run_listener(args)
+            else:
+                api_token, asset_uid = _command_credentials()
+                if args.command == "batch":
+                    result = _run_batch(args, api_token)
+                else:
+                    result = _run_single(args, api_token, asset_uid)
+    except (ValueError, OSError) as e:
+        print(json.dumps({"command": args.command, "ok": False, "error": str(e)}, indent=2), file=out)
+        return EXIT_USAGE
+    except KeyboardInterrupt:
+        print(json.dumps({"command": args.command, "ok": False, "error": "Interrupted"}, indent=2), file=out)
+        return EXIT_INTERRUPTED
+    print(json.dumps(result, indent=2, default=str), file=out)
+    return EXIT_OK if result["ok"] else EXIT_FAILED
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_command(sys.argv[1:]))
     try:
         main()
     except KeyboardInterrupt:
+        from utils import console
         console.print("\n[bold red]Operation cancelled by user[/]")
     finally:
         # Any cleanup operations here
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def idempotency_key(payload: Dict[str, Any]) -> str:
+    """Kobo ``_uuid`` of a submission, or a hash of the payload without one"""
+    uuid = payload.get("_uuid") or payload.get("meta/instanceID")
+    if uuid:
+        return str(uuid)
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return "sha1:" + hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class QueueItem:
+    id: int
+    key: str
+    payload: Dict[str, Any]
+    enqueued_at: float
+    attempts: int
+
+
+class IngestQueue:
+    """Durable webhook queue in a local SQLite file
+
+    Each submission is stored once per idempotency key; finished rows are
+    kept for ``retention`` seconds so repeated deliveries of the same
+    submission are recognised and dropped.
+    """
+
+    def __init__(self, path: str = "ingest_queue.db", retention: float = 7 * 24 * 3600,
+                 max_attempts: int = 5):
+        self.path = path
+        self.retention = retention
+        self.max_attempts = max_attempts
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                finished_at REAL,
+                error TEXT
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS queue_status ON queue (status, id)")
+        # Rows claimed by a worker that died are picked up again
+        self._conn.execute("UPDATE queue SET status = 'pending' WHERE status = 'processing'")
+
+    def put(self, payload: Dict[str, Any]) -> bool:
+        """Enqueue a payload; False if its key was already seen"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO queue (key, payload, enqueued_at) VALUES (?, ?, ?)",
+                (idempotency_key(payload), json.dumps(payload, ensure_ascii=False), time.time())
+            )
+            return cursor.rowcount == 1
+
+    def claim(self, limit: int) -> List[QueueItem]:
+        """Mark up to ``limit`` pending rows as processing and return them"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, key, payload, enqueued_at, attempts FROM queue "
+                    "WHERE status = 'pending' ORDER BY id LIMIT ?", (limit,)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE queue SET status = 'processing', attempts = attempts + 1 WHERE id = ?",
+                    [(row[0],) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [QueueItem(id, key, json.loads(payload), enqueued_at, attempts + 1)
+                for id, key, payload, enqueued_at, attempts in rows]
+
+    def complete(self, items: List[QueueItem]):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE queue SET status = 'done', finished_at = ?, error = NULL WHERE id = ?",
+                [(time.time(), item.id) for item in items]
+            )
+
+    def fail(self, items: List[QueueItem], error: str):
+        """Return items to the queue, or park them once max_attempts is reached"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE queue SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                [('failed' if item.attempts >= self.max_attempts else 'pending', now, error, item.id)
+                 for item in items]
+            )
+
+    def purge(self) -> int:
+        """Delete finished rows older than the retention window"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM queue WHERE status = 'done' AND finished_at < ?",
+                (time.time() - self.retention,)
+            )
+            return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM queue GROUP BY status").fetchall()
+        return dict(rows)
+
+    def depth(self) -> int:
+        """Rows waiting to be processed"""
+        counts = self.counts()
+        return counts.get("pending", 0) + counts.get("processing", 0)
+
+    def oldest_pending_age(self) -> float:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(enqueued_at) FROM queue WHERE status IN ('pending', 'processing')"
+            ).fetchone()
+        return time.time() - row[0] if row and row[0] else 0.0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class DrainStats:
+    """Throughput and enqueue-to-done lag of an IngestWorkerPool"""
+    processed: int = 0
+    failed: int = 0
+    batches: int = 0
+    total_lag: float = 0.0
+    max_lag: float = 0.0
+    last_lag: float = 0.0
+    started_at: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "drain_rate": round(self.processed / elapsed, 3) if elapsed else 0.0,
+            "avg_lag": round(self.total_lag / self.processed, 4) if self.processed else 0.0,
+            "max_lag": round(self.max_lag, 4),
+            "last_lag": round(self.last_lag, 4),
+        }
+
+
+class IngestWorkerPool:
+    """Background threads draining an IngestQueue in micro-batches
+
+    ``handler`` receives a list of QueueItems and returns the ones that
+    failed as ``(item, error)`` pairs; an exception fails the whole batch.
+    """
+
+    def __init__(self, queue: IngestQueue,
+                 handler: Callable[[List[QueueItem]], List[Tuple[QueueItem, str]]],
+                 workers: int = 2, batch_size: int = 50, poll_interval: float = 0.5):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stats = DrainStats()
+        self._stats_lock = Lock()
+        self._stop = Event()
+        self._threads: List[Thread] = []
+
+    def start(self):
+        self._stop.clear()
+        self.stats.started_at = time.time()
+        for n in range(self.workers):
+            thread = Thread(target=self._run, name=f"ingest-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = 10.0):
+        """Stop after the batches in flight finish"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        last_purge = time.monotonic()
+        while not self._stop.is_set():
+            items = self.queue.claim(self.batch_size)
+            if not items:
+                self._stop.wait(self.poll_interval)
+                continue
+            self.drain(items)
+            if time.monotonic() - last_purge > 3600:
+                self.queue.purge()
+                last_purge = time.monotonic()
+
+    def drain(self, items: List[QueueItem]):
+        """Process one claimed batch and record the outcome"""
+        try:
+            failures = self.handler(items)
+        except Exception as e:
+            failures = [(item, str(e)) for item in items]
+
+        failed_ids = {item.id for item, _ in failures}
+        done = [item for item in items if item.id not in failed_ids]
+        for item, error in failures:
+            self.queue.fail([item], error)
+        self.queue.complete(done)
+
+        now = time.time()
+        with self._stats_lock:
+            self.stats.batches += 1
+            self.stats.failed += len(failures)
+            self.stats.processed += len(done)
+            for item in done:
+                lag = now - item.enqueued_at
+                self.stats.total_lag += lag
+                self.stats.max_lag = max(self.stats.max_lag, lag)
+                self.stats.last_lag = lag
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth plus drain statistics"""
+        with self._stats_lock:
+            stats = self.stats.as_dict()
+        return {
+            "depth": self.queue.depth(),
+            "oldest_pending_age": round(self.queue.oldest_pending_age(), 3),
+            "statuses": self.queue.counts(),
+            **stats,
+        }
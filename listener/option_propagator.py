@@ -0,0 +1,177 @@
+import os
+import time
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Dict, Optional, Tuple
+
+from kobo_manager import ChoiceColumns, FormManager
+from services.option_sync_service import SyncDiff, build_value
+from services.pipeline_service import PipelineResult, UpdatePipeline
+from services.version_store import VersionStore
+from utils.text import full_name, normalize_label
+
+
+class OptionPropagator:
+    """Pushes newly registered names to a form's choice list in batches
+
+    Names are collected until no new one arrived for ``debounce`` seconds,
+    ``max_batch`` are pending, or the oldest has waited ``max_wait``
+    seconds. Each batch becomes one choice update plus redeploy. Only one
+    push runs at a time; names arriving meanwhile go into the next batch.
+    """
+
+    def __init__(self, form: FormManager, list_name: str, debounce: float = 10.0,
+                 max_wait: float = 60.0, max_batch: int = 200, retry_after: float = 30.0):
+        self.form = form
+        self.list_name = list_name
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.retry_after = retry_after
+        # normalised label -> (label, base value)
+        self._pending: Dict[str, Tuple[str, str]] = {}
+        self._first_at: Optional[float] = None
+        self._last_at: Optional[float] = None
+        self._cond = Condition()
+        self._flight = Lock()
+        self._stopping = False
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+        self.pushes = 0
+        self.pushed_names = 0
+        self.last_result: Optional[PipelineResult] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["OptionPropagator"]:
+        """Build from KOBO_* settings; None unless KOBO_OPTION_LIST is set
+
+        KOBO_API_TOKEN and ASSET_UID are then required (ValueError if
+        missing); KOBO_BASE_URL, KOBO_SNAPSHOT_DIR and KOBO_HISTORY_DIR are
+        used as by the CLI commands.
+        """
+        list_name = os.getenv("KOBO_OPTION_LIST")
+        if not list_name:
+            return None
+        api_token = os.getenv("KOBO_API_TOKEN")
+        asset_uid = os.getenv("ASSET_UID")
+        missing = [name for name, value in (("KOBO_API_TOKEN", api_token), ("ASSET_UID", asset_uid))
+                   if not value]
+        if missing:
+            raise ValueError(f"KOBO_OPTION_LIST requires {' and '.join(missing)} to be set")
+        options = {}
+        if os.getenv("KOBO_BASE_URL"):
+            options["base_url"] = os.getenv("KOBO_BASE_URL")
+        history_dir = os.getenv("KOBO_HISTORY_DIR")
+        form = FormManager(
+            api_token, asset_uid,
+            snapshot_dir=os.getenv("KOBO_SNAPSHOT_DIR"),
+            history=VersionStore.in_dir(history_dir) if history_dir else None,
+            **options
+        )
+        return cls(
+            form, list_name,
+            debounce=float(os.getenv("KOBO_OPTION_DEBOUNCE", 10)),
+            max_batch=int(os.getenv("KOBO_OPTION_MAX_BATCH", 200)),
+        )
+
+    def add(self, nombre: str, paterno: str, materno: Optional[str] = None):
+        """Queue a registered name for the next push"""
+        label = full_name(nombre, paterno, materno)
+        key = normalize_label(label)
+        if not key:
+            return
+        with self._cond:
+            if key not in self._pending:
+                self._pending[key] = (label, build_value(nombre, paterno, materno))
+            now = time.monotonic()
+            self._first_at = self._first_at or now
+            self._last_at = now
+            self._cond.notify()
+
+    def _due(self, now: float) -> bool:
+        """Whether the pending batch should be pushed (lock held)"""
+        if not self._pending:
+            return False
+        return (
+            self._stopping
+            or len(self._pending) >= self.max_batch
+            or now - self._last_at >= self.debounce
+            or now - self._first_at >= self.max_wait
+        )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due(time.monotonic()):
+                    if self._stopping:
+                        return
+                    if self._pending:
+                        now = time.monotonic()
+                        timeout = min(self._last_at + self.debounce, self._first_at + self.max_wait) - now
+                        self._cond.wait(max(timeout, 0.01))
+                    else:
+                        self._cond.wait()
+                batch, self._pending = self._pending, {}
+                self._first_at = self._last_at = None
+            pushed = self.flush(batch)
+            if self._stopping:
+                return
+            if not pushed:
+                self._stopped.wait(self.retry_after)
+
+    def flush(self, batch: Dict[str, Tuple[str, str]]) -> bool:
+        """Push one batch; on failure its names are queued again"""
+        with self._flight:
+            result = UpdatePipeline(self.form).run(self._plan(batch))
+        self.last_result = result
+        if result.ok:
+            self.pushes += 1
+            self.pushed_names += result.changes.get("added", 0)
+            return True
+
+        print(f"Option propagation failed: {result.error}")
+        with self._cond:
+            for key, entry in batch.items():
+                self._pending.setdefault(key, entry)
+            now = time.monotonic()
+            self._first_at = self._first_at or now
+            self._last_at = self._last_at or now
+        return False
+
+    def _plan(self, batch: Dict[str, Tuple[str, str]]):
+        def plan(form: FormManager) -> SyncDiff:
+            diff = SyncDiff(self.list_name, added=ChoiceColumns(self.list_name))
+            taken = set()
+            for label, base_value in batch.values():
+                if form.choices.has_label(self.list_name, label):
+                    continue
+                value = form.choices.unique_value(self.list_name, base_value, taken=taken)
+                taken.add(value)
+                diff.added.append(value, label)
+            return diff
+        return plan
+
+    def start(self):
+        self._stopping = False
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name="option-propagator", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 60.0):
+        """Push whatever is pending, then stop"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "pushes": self.pushes,
+            "pushed_names": self.pushed_names,
+            "last_result": self.last_result.as_dict() if self.last_result else None,
+        }
@@ -1,78 +1,405 @@
+import cProfile
 import os
 import signal
 import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from flask import Flask, request, jsonify
-from threading import Thread
-from pyngrok import ngrok
-from database.supabase_client import SupabaseClient
+from threading import Condition, Event, Lock, Thread
+from database.connection_pool import ConnectionPool
+from database.supabase_client import SupabaseClient, get_pool
+from listener.ingest_queue import IngestQueue, IngestWorkerPool, QueueItem
+from listener.option_propagator import OptionPropagator
+from services.ngrok_service import NgrokService
+from utils.metrics import metrics
+from utils.text import full_name
+
+REGISTRATION_OPTION = 'no_registrado_en_el_padr_n'
+
+WEBHOOK_OUTCOMES = metrics.counter(
+    "webhook_registrations_total",
+    "Webhook payloads by outcome (not_registration, invalid, exists, added, queued, duplicate, error)",
+    ("outcome",),
+)
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "webhook_http_request_seconds", "Listener request latency", ("route", "status")
+)
+QUEUE_DEPTH = metrics.gauge("webhook_queue_depth", "Registrations waiting in the ingest queue")
+PROPAGATION_PENDING = metrics.gauge("webhook_option_pending", "Names waiting to be pushed to the form")
+DB_POOL_CONNECTIONS = metrics.gauge("supabase_pool_connections", "Pooled connections", ("state",))
+
+
+def replay_export(path: str, batch_size: int = 1000) -> Dict[str, int]:
+    """Insert the registrations found in an NDJSON submission export
+
+    Uses the same filtering as the webhook endpoint and the batch insert
+    path, so names already in the registry are skipped.
+    """
+    totals = {"inserted": 0, "skipped": 0}
+
+    def flush(batch):
+        with SupabaseClient() as db_client:
+            result = db_client.insert_registrations(batch, page_size=batch_size)
+        for key in totals:
+            totals[key] += result[key]
+
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if data.get('opcion') != REGISTRATION_OPTION or not WebhookListener._get_full_name(data):
+                continue
+            batch.append(data)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    if batch:
+        flush(batch)
+    return totals
+
 
 class WebhookListener:
-    """Manages webhook listener with graceful shutdown capabilities"""
-    
-    def __init__(self):
+    """Manages webhook listener with graceful shutdown capabilities
+
+    With ``async_ingest`` (or ``WEBHOOK_ASYNC=1``) the endpoint only
+    validates and queues registrations in a local SQLite file and answers
+    202; a pool of background workers writes them to the database.
+
+    Requests are served by waitress with ``threads`` worker threads
+    (``WEBHOOK_SERVER=flask`` falls back to the threaded development
+    server). ``stop`` refuses new requests, waits for the ones in flight
+    and then shuts the server down.
+
+    When ``KOBO_OPTION_LIST`` is set, newly registered names are also
+    pushed to that choice list in debounced batches (see OptionPropagator).
+
+    ``GET /metrics`` serves Prometheus metrics. With ``profile_dir`` (or
+    ``WEBHOOK_PROFILE_DIR``) set, a request sent with ``?profile=1`` or an
+    ``X-Profile: 1`` header is run under cProfile and its stats are saved
+    there; the file name is returned in ``X-Profile-File``.
+
+    An ngrok tunnel is opened by ``start`` when ``tunnel`` is true; by
+    default when ``WEBHOOK_TUNNEL`` is set to 1, or is unset and
+    ``NGROK_AUTH_TOKEN`` is. Leave it off behind your own reverse proxy.
+    """
+
+    def __init__(self, async_ingest: Optional[bool] = None, host: Optional[str] = None,
+                 port: Optional[int] = None, threads: Optional[int] = None,
+                 server: Optional[str] = None, profile_dir: Optional[str] = None,
+                 tunnel: Optional[bool] = None):
         self.app = Flask(__name__)
+        self.host = host or os.getenv("WEBHOOK_HOST", "0.0.0.0")
+        self.port = int(port or os.getenv("WEBHOOK_PORT", 5000))
+        self.threads = int(threads or os.getenv("WEBHOOK_THREADS", 8))
+        self.server_backend = server or os.getenv("WEBHOOK_SERVER", "waitress")
         self.server = None
-        self.ngrok_tunnel = None
+        self._httpd = None
+        self._in_flight = 0
+        self._draining = False
+        self._requests = Condition()
+        self.tunnel = NgrokService.enabled() if tunnel is None else tunnel
+        self.public_url: Optional[str] = None
+        profile_dir = profile_dir or os.getenv("WEBHOOK_PROFILE_DIR")
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        # cProfile allows one active profiler at a time
+        self._profiling = Lock()
+        if async_ingest is None:
+            async_ingest = os.getenv("WEBHOOK_ASYNC", "0") == "1"
+        self.queue: Optional[IngestQueue] = None
+        self.workers: Optional[IngestWorkerPool] = None
+        if async_ingest:
+            self.queue = IngestQueue(os.getenv("WEBHOOK_QUEUE_PATH", "ingest_queue.db"))
+            self.workers = IngestWorkerPool(
+                self.queue,
+                self._process_batch,
+                workers=int(os.getenv("WEBHOOK_WORKERS", 2)),
+                batch_size=int(os.getenv("WEBHOOK_BATCH_SIZE", 50)),
+            )
+        self.propagator = OptionPropagator.from_env()
         self._setup_routes()
-        self._configure_ngrok()
+        metrics.on_collect(self._collect_metrics)
 
     def _configure_ngrok(self):
-        """Configure ngrok tunnel"""
-        ngrok.set_auth_token(os.getenv("NGROK_AUTH_TOKEN"))
-        self.ngrok_tunnel = ngrok.connect(5000)
-        print(f" * ngrok tunnel {self.ngrok_tunnel.public_url} -> http://127.0.0.1:5000")
+        """Open the ngrok tunnel to the listener port"""
+        NgrokService.initialize()
+        self.public_url = NgrokService.get_public_url(self.port)
+        print(f" * ngrok tunnel {self.public_url} -> http://127.0.0.1:{self.port}")
 
     def _setup_routes(self):
         """Configure Flask routes"""
+        @self.app.before_request
+        def track_request():
+            request.environ["webhook.started"] = time.perf_counter()
+            with self._requests:
+                if self._draining:
+                    return jsonify({"error": "Shutting down"}), 503, {"Retry-After": "5"}
+                self._in_flight += 1
+                request.environ["webhook.tracked"] = True
+            self._start_profile()
+
+        @self.app.after_request
+        def observe_request(response):
+            self._stop_profile(response)
+            started = request.environ.get("webhook.started")
+            if started is not None:
+                route = request.url_rule.rule if request.url_rule else "unmatched"
+                HTTP_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, route=route, status=response.status_code
+                )
+            return response
+
+        @self.app.teardown_request
+        def untrack_request(exc):
+            # Still set if after_request didn't run (unhandled error)
+            profiler = request.environ.pop("webhook.profiler", None)
+            if profiler is not None:
+                profiler.disable()
+                self._profiling.release()
+            if request.environ.pop("webhook.tracked", False):
+                with self._requests:
+                    self._in_flight -= 1
+                    self._requests.notify_all()
+
         @self.app.route('/', methods=['POST'])
         def handle_webhook():
+            if self.queue is not None:
+                return self._enqueue_webhook(request)
             return self._process_webhook(request)
 
+        @self.app.route('/queue', methods=['GET'])
+        def queue_status():
+            if self.workers is None:
+                return jsonify({"error": "Async ingestion is disabled"}), 404
+            return jsonify(self.workers.snapshot()), 200
+
+        @self.app.route('/options', methods=['GET'])
+        def option_status():
+            if self.propagator is None:
+                return jsonify({"error": "Option propagation is disabled"}), 404
+            return jsonify(self.propagator.snapshot()), 200
+
+        @self.app.route('/metrics', methods=['GET'])
+        def metrics_endpoint():
+            return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    def _start_profile(self):
+        """Profile this request if profiling is enabled and it asks for it"""
+        if self.profile_dir is None:
+            return
+        if request.args.get("profile") != "1" and request.headers.get("X-Profile") != "1":
+            return
+        if not self._profiling.acquire(blocking=False):
+            return
+        profiler = cProfile.Profile()
+        request.environ["webhook.profiler"] = profiler
+        profiler.enable()
+
+    def _stop_profile(self, response):
+        profiler = request.environ.pop("webhook.profiler", None)
+        if profiler is None:
+            return
+        profiler.disable()
+        self._profiling.release()
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}-{request.method}.prof"
+        profiler.dump_stats(self.profile_dir / name)
+        response.headers["X-Profile-File"] = name
+
+    def _collect_metrics(self):
+        """Refresh gauges before /metrics is rendered"""
+        if self.queue is not None:
+            QUEUE_DEPTH.set(self.queue.depth())
+        if self.propagator is not None:
+            PROPAGATION_PENDING.set(self.propagator.snapshot()["pending"])
+        pool = get_pool()
+        DB_POOL_CONNECTIONS.set(pool.size, state="open")
+        DB_POOL_CONNECTIONS.set(pool.in_use, state="in_use")
+
+    def _validate(self, data: dict) -> Optional[tuple]:
+        """Response for payloads that should not be stored, else None"""
+        if data.get('opcion') != REGISTRATION_OPTION:
+            WEBHOOK_OUTCOMES.inc(outcome="not_registration")
+            return jsonify({"message": "Not a registration attempt"}), 200
+        if not self._get_full_name(data):
+            WEBHOOK_OUTCOMES.inc(outcome="invalid")
+            return jsonify({"error": "Missing name fields"}), 400
+        return None
+
+    def _register(self, db_client: SupabaseClient, data: dict) -> Tuple[str, int]:
+        """Insert a validated registration unless the name already exists"""
+        if db_client.check_existing_entry(self._get_full_name(data)):
+            WEBHOOK_OUTCOMES.inc(outcome="exists")
+            return "Entry exists", 200
+        db_client.insert_registration(data)
+        WEBHOOK_OUTCOMES.inc(outcome="added")
+        self._propagate(data)
+        return "Registration added", 201
+
+    def _propagate(self, data: dict):
+        """Hand a newly registered name to the option propagator, if enabled"""
+        if self.propagator is not None:
+            parts = self._get_name_parts(data)
+            if parts:
+                self.propagator.add(*parts)
+
     def _process_webhook(self, request) -> tuple:
         """Process incoming webhook data"""
         try:
             data = request.get_json(silent=True) or {}
-            
+
             # Process registration attempt
-            if data.get('opcion') != 'no_registrado_en_el_padr_n':
-                return jsonify({"message": "Not a registration attempt"}), 200
+            rejected = self._validate(data)
+            if rejected:
+                return rejected
 
             # Database operations
             with SupabaseClient() as db_client:
-                full_name = self._get_full_name(data)
-                if not full_name:
-                    return jsonify({"error": "Missing name fields"}), 400
-                
-                if db_client.check_existing_entry(full_name):
-                    return jsonify({"message": "Entry exists"}), 200
-                
-                db_client.insert_registration(data)
-                return jsonify({"message": "Registration added"}), 201
+                message, status = self._register(db_client, data)
+                return jsonify({"message": message}), status
 
         except Exception as e:
+            WEBHOOK_OUTCOMES.inc(outcome="error")
+            print(f"Webhook processing failed: {type(e).__name__}: {e}")
             return jsonify({"error": str(e)}), 500
 
-    def _get_full_name(self, data: dict) -> Optional[str]:
-        """Extract full name from data"""
+    def _enqueue_webhook(self, request) -> tuple:
+        """Validate and queue a registration for the background workers"""
+        try:
+            data = request.get_json(silent=True) or {}
+            rejected = self._validate(data)
+            if rejected:
+                return rejected
+
+            if not self.queue.put(data):
+                WEBHOOK_OUTCOMES.inc(outcome="duplicate")
+                return jsonify({"message": "Already received"}), 200
+            WEBHOOK_OUTCOMES.inc(outcome="queued")
+            return jsonify({"message": "Registration queued"}), 202
+
+        except Exception as e:
+            WEBHOOK_OUTCOMES.inc(outcome="error")
+            print(f"Webhook queueing failed: {type(e).__name__}: {e}")
+            return jsonify({"error": str(e)}), 500
+
+    def _process_batch(self, items: List[QueueItem]) -> List[Tuple[QueueItem, str]]:
+        """Write a batch of queued registrations over one pooled connection
+
+        The batch goes in as one multi-row insert; if that fails the rows
+        are retried one by one so a single bad payload doesn't fail the rest.
+        """
+        failures = []
+        with SupabaseClient() as db_client:
+            try:
+                result = db_client.insert_registrations(item.payload for item in items)
+                WEBHOOK_OUTCOMES.inc(result["inserted"], outcome="added")
+                WEBHOOK_OUTCOMES.inc(result["skipped"], outcome="exists")
+                # Only new registry names; ones already in the registry may have
+                # been removed from the form on purpose
+                for data in result["records"]:
+                    self._propagate(data)
+                return failures
+            except Exception:
+                db_client.connection.rollback()
+
+            for item in items:
+                try:
+                    self._register(db_client, item.payload)
+                except Exception as e:
+                    db_client.connection.rollback()
+                    WEBHOOK_OUTCOMES.inc(outcome="error")
+                    failures.append((item, str(e)))
+        return failures
+
+    @staticmethod
+    def _get_name_parts(data: dict) -> Optional[Tuple[str, str, str]]:
+        """Extract (nombre, apellido paterno, apellido materno) from data"""
         name_keys = [
             ('nombre', 'apellido paterno', 'apellido materno'),
             ('Nombre', 'Apellido_paterno', 'Apellido_materno')
         ]
         for keys in name_keys:
             if all(k in data for k in keys[:2]):
-                parts = [data.get(k, '') for k in keys]
-                return ' '.join(parts).strip()
+                return tuple(data.get(k) or '' for k in keys)
         return None
 
+    @staticmethod
+    def _get_full_name(data: dict) -> Optional[str]:
+        """Extract full name from data"""
+        parts = WebhookListener._get_name_parts(data)
+        return full_name(*parts) if parts else None
+
+    def _make_server(self):
+        """Create the WSGI server for the configured backend"""
+        if self.server_backend == "flask":
+            from werkzeug.serving import make_server
+            return make_server(self.host, self.port, self.app, threaded=True)
+        try:
+            from waitress import create_server
+        except ImportError as e:
+            raise ImportError("Serving the listener requires waitress: pip install waitress") from e
+        return create_server(self.app, host=self.host, port=self.port, threads=self.threads)
+
+    def _shutdown_server(self):
+        if self.server_backend == "flask":
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        else:
+            from waitress import wasyncore
+            self._httpd.task_dispatcher.shutdown()
+            wasyncore.close_all(self._httpd._map)
+
     def start(self):
         """Start the listener in background thread"""
-        self.server = Thread(target=lambda: self.app.run(host="0.0.0.0", port=5000))
+        if self.workers is not None:
+            self.workers.start()
+        if self.propagator is not None:
+            self.propagator.start()
+        self._draining = False
+        self._httpd = self._make_server()
+        run = self._httpd.serve_forever if self.server_backend == "flask" else self._httpd.run
+        self.server = Thread(target=run, name="webhook-server")
         self.server.daemon = True
         self.server.start()
-        print("Listener started")
+        print(f"Listener started on {self.host}:{self.port} ({self.server_backend})")
+        # Only once the server is up, so a failing tunnel doesn't delay local traffic
+        if self.tunnel:
+            self._configure_ngrok()
+
+    def serve_forever(self, drain_timeout: float = 30.0):
+        """Run until SIGINT/SIGTERM, then shut down gracefully"""
+        stop_requested = Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop_requested.set())
+        self.start()
+        stop_requested.wait()
+        self.stop(drain_timeout)
+
+    def stop(self, drain_timeout: float = 30.0):
+        """Stop the listener and clean up resources
 
-    def stop(self):
-        """Stop the listener and clean up resources"""
-        if self.ngrok_tunnel:
-            ngrok.disconnect(self.ngrok_tunnel.public_url)
-        print("\nListener stopped gracefully")
\ No newline at end of file
+        New requests get a 503 while those already running are given up to
+        ``drain_timeout`` seconds to finish.
+        """
+        if self._httpd is not None:
+            deadline = time.monotonic() + drain_timeout
+            with self._requests:
+                self._draining = True
+                while self._in_flight and time.monotonic() < deadline:
+                    self._requests.wait(deadline - time.monotonic())
+            self._shutdown_server()
+            self.server.join(5)
+            self._httpd = None
+        if self.public_url:
+            NgrokService.disconnect(self.public_url)
+            self.public_url = None
+        if self.workers is not None:
+            self.workers.stop()
+            self.queue.close()
+        if self.propagator is not None:
+            self.propagator.stop()
+        metrics.remove_collector(self._collect_metrics)
+        ConnectionPool.close_all()
+        print("\nListener stopped gracefully")
@@ -0,0 +1,306 @@
+import csv
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from services.submission_mirror import DuckDBMirrorSink, MirrorSink
+
+
+class ExportCheckpoint:
+    """Resumable export position persisted next to the output file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.last_id: Optional[int] = None
+        self.last_submission_time: Optional[str] = None
+        self.exported = 0
+        self.complete = False
+        # When the last full (non-incremental) export finished
+        self.reconciled_at: Optional[float] = None
+
+    @classmethod
+    def for_output(cls, output: Path) -> "ExportCheckpoint":
+        output = Path(output)
+        return cls(output.with_name(output.name + ".checkpoint.json")).load()
+
+    def load(self) -> "ExportCheckpoint":
+        """Read checkpoint state from disk if it exists"""
+        if self.path.exists():
+            with open(self.path) as f:
+                state = json.load(f)
+            self.last_id = state.get("last_id")
+            self.last_submission_time = state.get("last_submission_time")
+            self.exported = state.get("exported", 0)
+            self.complete = state.get("complete", False)
+            self.reconciled_at = state.get("reconciled_at")
+        return self
+
+    def save(self):
+        """Atomically write checkpoint state"""
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({
+                "last_id": self.last_id,
+                "last_submission_time": self.last_submission_time,
+                "exported": self.exported,
+                "complete": self.complete,
+                "reconciled_at": self.reconciled_at,
+            }, f)
+        os.replace(tmp, self.path)
+
+    def reset(self):
+        self.last_id = None
+        self.last_submission_time = None
+        self.exported = 0
+        self.complete = False
+        self.reconciled_at = None
+
+    def reconcile_due(self, interval: float) -> bool:
+        """True when no full export happened within the last ``interval`` seconds"""
+        return self.reconciled_at is None or time.time() - self.reconciled_at >= interval
+
+    def advance(self, last_record: Dict, count: int):
+        """Move the cursor past ``count`` rows ending with ``last_record``"""
+        self.last_id = last_record.get("_id", self.last_id)
+        self.last_submission_time = last_record.get("_submission_time", self.last_submission_time)
+        self.exported += count
+
+
+def _flatten_value(value: Any) -> Any:
+    """Encode nested values (repeat groups, attachments) for flat sinks"""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class NDJSONSink:
+    """Writes one JSON document per line"""
+
+    def __init__(self, path: Path, append: bool = False):
+        self.path = Path(path)
+        self._file = open(self.path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, records: List[Dict]) -> bool:
+        """Write records; returns True once they are durable on disk"""
+        self._file.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        self._file.flush()
+        return True
+
+    def close(self) -> bool:
+        self._file.close()
+        return True
+
+
+class CsvSink:
+    """Writes records as CSV rows
+
+    Columns start from ``fieldnames`` or the header of the file being
+    appended to, and grow with every key seen. Kobo leaves unanswered
+    questions out of a submission, so a question first answered on a later
+    page adds a column: the file written so far is then rewritten with the
+    wider header.
+    """
+
+    def __init__(self, path: Path, append: bool = False, fieldnames: Optional[List[str]] = None):
+        self.path = Path(path)
+        self.fieldnames: List[str] = list(fieldnames or [])
+        if append and self.path.exists() and self.path.stat().st_size:
+            with open(self.path, newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f))
+            self.fieldnames = header + [k for k in self.fieldnames if k not in header]
+            if len(self.fieldnames) > len(header):
+                self._rewrite()
+        else:
+            with open(self.path, "w", newline="", encoding="utf-8") as f:
+                if self.fieldnames:
+                    csv.writer(f).writerow(self.fieldnames)
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames)
+
+    def _rewrite(self):
+        """Rewrite the file under the current ``fieldnames``"""
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(self.path, newline="", encoding="utf-8") as src, \
+                open(tmp, "w", newline="", encoding="utf-8") as dst:
+            writer = csv.DictWriter(dst, fieldnames=self.fieldnames)
+            writer.writeheader()
+            writer.writerows(csv.DictReader(src))
+        os.replace(tmp, self.path)
+
+    def write(self, records: List[Dict]) -> bool:
+        if not records:
+            return True
+        known = set(self.fieldnames)
+        new_keys = [k for k in dict.fromkeys(k for r in records for k in r) if k not in known]
+        if new_keys:
+            self._file.close()
+            self.fieldnames += new_keys
+            self._rewrite()
+            self._open()
+        self._writer.writerows({k: _flatten_value(v) for k, v in r.items()} for r in records)
+        self._file.flush()
+        return True
+
+    def close(self) -> bool:
+        self._file.close()
+        return True
+
+
+class ParquetSink:
+    """Writes records to a directory of Parquet part files (requires pyarrow)
+
+    Rows are buffered up to ``rows_per_file`` and every column is stored as a
+    string, since submissions of different form versions have different fields.
+    Resuming adds new part files next to the existing ones.
+    """
+
+    def __init__(self, path: Path, append: bool = False, rows_per_file: int = 50_000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow: pip install pyarrow") from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        if not append:
+            for part in self.path.glob("part-*.parquet"):
+                part.unlink()
+        self._part = len(list(self.path.glob("part-*.parquet")))
+        self.rows_per_file = rows_per_file
+        self._buffer: List[Dict] = []
+
+    def write(self, records: List[Dict]) -> bool:
+        self._buffer.extend(records)
+        if len(self._buffer) < self.rows_per_file:
+            return False
+        return self._write_part()
+
+    def _write_part(self) -> bool:
+        if not self._buffer:
+            return True
+        columns = list(dict.fromkeys(k for r in self._buffer for k in r))
+        table = self._pa.table({
+            col: self._pa.array(
+                [None if r.get(col) is None else str(_flatten_value(r[col])) for r in self._buffer],
+                type=self._pa.string()
+            )
+            for col in columns
+        })
+        self._pq.write_table(table, self.path / f"part-{self._part:05d}.parquet")
+        self._part += 1
+        self._buffer = []
+        return True
+
+    def close(self) -> bool:
+        return self._write_part()
+
+
+SINKS = {
+    "ndjson": NDJSONSink,
+    "jsonl": NDJSONSink,
+    "csv": CsvSink,
+    "parquet": ParquetSink,
+    "sqlite": MirrorSink,
+    "sqlite3": MirrorSink,
+    "db": MirrorSink,
+    "duckdb": DuckDBMirrorSink,
+}
+# Formats whose sink takes the form's survey to build its tables
+MIRROR_FORMATS = {fmt for fmt, sink in SINKS.items() if issubclass(sink, MirrorSink)}
+
+
+def infer_format(path: Path) -> str:
+    """Guess the sink format from the output file extension"""
+    suffix = Path(path).suffix.lstrip(".").lower()
+    return suffix if suffix in SINKS else "ndjson"
+
+
+class SubmissionExporter:
+    """Streams submissions page by page from a FormManager into a sink
+
+    Pages are requested in ``_id`` order and the checkpoint is only advanced
+    once the sink reports the rows as durable, so an interrupted export
+    resumes after the last saved ``_id`` (a page may be written twice if the
+    process dies between the write and the checkpoint save).
+    """
+
+    def __init__(self, client, page_size: int = 1000):
+        self.client = client
+        self.page_size = page_size
+
+    def iter_pages(self, query: Optional[Dict] = None, fields: Optional[List[str]] = None) -> Iterator[List[Dict]]:
+        """Yield pages of submissions in ``_id`` order (see FormManager.iter_pages)"""
+        return self.client.iter_pages(query, fields, page_size=self.page_size)
+
+    def iter_submissions(self, query: Optional[Dict] = None) -> Iterator[Dict]:
+        for page in self.iter_pages(query):
+            yield from page
+
+    def export(self, path: str, fmt: Optional[str] = None, resume: bool = True,
+               incremental: bool = False, **sink_options) -> int:
+        """Export submissions to ``path``; returns the number written in this run
+
+        With ``incremental`` a finished export is treated as a high-water
+        mark: only submissions with a larger ``_id`` are fetched and appended.
+        """
+        path = Path(path)
+        fmt = fmt or infer_format(path)
+        checkpoint = ExportCheckpoint.for_output(path)
+
+        resuming = (
+            checkpoint.last_id is not None and path.exists()
+            and (incremental or (resume and not checkpoint.complete))
+        )
+        if not resuming:
+            checkpoint.reset()
+        query = {"_id": {"$gt": checkpoint.last_id}} if resuming else None
+
+        sink = SINKS[fmt](path, append=resuming, **sink_options)
+        written = 0
+        # Rows handed to the sink that it has not yet reported as durable
+        pending_rows = 0
+        last_record: Optional[Dict] = None
+        try:
+            for page in self.iter_pages(query):
+                written += len(page)
+                pending_rows += len(page)
+                last_record = page[-1]
+                if sink.write(page):
+                    checkpoint.advance(last_record, pending_rows)
+                    checkpoint.save()
+                    pending_rows = 0
+        finally:
+            if sink.close() and pending_rows:
+                checkpoint.advance(last_record, pending_rows)
+                checkpoint.save()
+        checkpoint.complete = True
+        if not resuming:
+            checkpoint.reconciled_at = time.time()
+        checkpoint.save()
+        return written
+
+    def reconcile(self, path: str, fmt: Optional[str] = None, **sink_options) -> int:
+        """Rebuild ``path`` from a full export and swap it in
+
+        Incremental runs only see new ``_id`` values, so edited or deleted
+        submissions are picked up here. The old output stays readable until
+        the new one is complete.
+        """
+        path = Path(path)
+        fmt = fmt or infer_format(path)
+        staging = path.with_name(path.name + ".reconcile")
+        written = self.export(staging, fmt=fmt, **sink_options)
+
+        if path.is_dir():
+            shutil.rmtree(path)
+        os.replace(staging, path)
+        os.replace(ExportCheckpoint.for_output(staging).path, ExportCheckpoint.for_output(path).path)
+        return written
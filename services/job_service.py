@@ -0,0 +1,304 @@
+import csv
+import inspect
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from kobo_manager import Choice, FormManager
+from kobo_manager_async import AsyncRateLimiter
+from services.pipeline_service import UpdatePipeline, choices_plan, registry_plan
+from services.version_store import VersionStore
+
+
+class JobError(RuntimeError):
+    """A job failed; ``details`` is kept in its result"""
+
+    def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.details = details or {}
+
+
+def load_choices(path: str, list_name: Optional[str] = None) -> List[Choice]:
+    """Read choices from a CSV or JSON file
+
+    CSV needs ``value`` (or ``name``) and ``label`` columns; a JSON file is
+    a list of objects with the same keys. ``list_name`` is taken from each
+    row or, when missing, from the argument.
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        rows = json.loads(path.read_text(encoding="utf-8"))
+        if not isinstance(rows, list):
+            raise ValueError(f"{path} must contain a list of choices")
+    else:
+        with path.open(newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+
+    choices = []
+    for number, row in enumerate(rows, 1):
+        row_list = row.get("list_name") or list_name
+        value = row.get("value") or row.get("name")
+        label = row.get("label")
+        if not (row_list and value and label):
+            raise ValueError(f"{path} row {number}: list_name, value and label are required")
+        choices.append(Choice(row_list, str(value), str(label)))
+    return choices
+
+
+def _pipeline_result(result) -> Dict[str, Any]:
+    if not result.ok:
+        raise JobError(result.error, result.as_dict())
+    return result.as_dict()
+
+
+def export_job(form: FormManager, output: str, format: Optional[str] = None,
+               incremental: bool = False, page_size: int = 1000,
+               reconcile_interval: Optional[float] = None,
+               indexes: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Export submissions to ``output`` (see FormManager.export_data)"""
+    options = {"indexes": indexes} if indexes else {}
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    exported = form.export_data(output, fmt=format, incremental=incremental, page_size=page_size,
+                                reconcile_interval=reconcile_interval, **options)
+    return {"output": output, "exported": exported}
+
+
+def sync_options_job(form: FormManager, list_name: str, remove_missing: bool = False,
+                     update_labels: bool = False, redeploy: bool = True, dry_run: bool = False,
+                     max_changes: Optional[int] = None) -> Dict[str, Any]:
+    """Sync ``list_name`` with the registry table"""
+    from database.supabase_client import db_config_from_env
+
+    plan = registry_plan(db_config_from_env(), list_name, remove_missing=remove_missing,
+                         update_labels=update_labels)
+    pipeline = UpdatePipeline(form, redeploy=redeploy, dry_run=dry_run, max_changes=max_changes)
+    return _pipeline_result(pipeline.run(plan))
+
+
+def add_choices_job(form: FormManager, file: str, list_name: Optional[str] = None,
+                    redeploy: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+    """Add the choices in ``file`` that aren't in their list yet"""
+    pipeline = UpdatePipeline(form, redeploy=redeploy, dry_run=dry_run)
+    return _pipeline_result(pipeline.run(choices_plan(load_choices(file, list_name))))
+
+
+def redeploy_job(form: FormManager, version_id: Optional[str] = None) -> Dict[str, Any]:
+    """Deploy ``version_id`` (restored from the history if needed) or the latest version"""
+    if not form.refresh_version_info():
+        raise JobError("Failed to fetch version information")
+    if not version_id and not form.needs_redeploy():
+        return {"version_id": form.latest_version_id, "deployed": False}
+    if not form.redeploy_form(version_id):
+        raise JobError("Redeployment failed")
+    return {"version_id": form.deployed_version_id, "deployed": True}
+
+
+# Commands available to manifests, by name
+JOBS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "export": export_job,
+    "sync-options": sync_options_job,
+    "add-choices": add_choices_job,
+    "redeploy": redeploy_job,
+}
+
+
+@dataclass
+class Job:
+    command: str
+    asset_uid: str
+    options: Dict[str, Any] = field(default_factory=dict)
+
+    def validate(self):
+        """Raise ValueError for unknown commands or options"""
+        if self.command not in JOBS:
+            raise ValueError(f"Unknown command '{self.command}' (expected one of: {', '.join(JOBS)})")
+        if not self.asset_uid:
+            raise ValueError(f"'{self.command}' job has no asset_uid")
+        try:
+            inspect.signature(JOBS[self.command]).bind(None, **self.options)
+        except TypeError as e:
+            raise ValueError(f"'{self.command}' job for {self.asset_uid}: {e}") from e
+
+
+@dataclass
+class JobResult:
+    """Outcome of one job; ``skipped`` jobs never ran"""
+    command: str
+    asset_uid: Optional[str]
+    ok: bool = False
+    skipped: bool = False
+    result: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    duration: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "command": self.command,
+            "asset_uid": self.asset_uid,
+            "ok": self.ok,
+            "skipped": self.skipped,
+            "result": self.result,
+            "error": self.error,
+            "duration": round(self.duration, 3),
+        }
+
+
+def run_job(form: FormManager, job: Job) -> JobResult:
+    """Run ``job`` on ``form``; failures are reported in the result, not raised"""
+    result = JobResult(job.command, job.asset_uid)
+    started = time.perf_counter()
+    try:
+        result.result = JOBS[job.command](form, **job.options)
+        result.ok = True
+    except JobError as e:
+        result.error = str(e)
+        result.result = e.details
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.duration = time.perf_counter() - started
+    return result
+
+
+@dataclass
+class JobReport:
+    results: List[JobResult] = field(default_factory=list)
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(r.ok for r in self.results)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "ok": self.ok,
+            "jobs": len(self.results),
+            "failed": sum(1 for r in self.results if not r.ok and not r.skipped),
+            "skipped": sum(1 for r in self.results if r.skipped),
+            "duration": round(self.duration, 3),
+            "results": [r.as_dict() for r in self.results],
+        }
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """Read a batch manifest and expand it into Job objects
+
+    The manifest is a JSON object with a ``jobs`` list, optional
+    ``defaults`` given to every job whose command takes them, and runner settings
+    (``workers``, ``requests_per_second``, ``timeout``). A job's
+    ``asset_uid`` may be a list to run it on several projects, and
+    ``{asset_uid}`` in its string options is replaced per project.
+    Everything is validated before any job runs.
+    """
+    manifest = json.loads(Path(path).read_text(encoding="utf-8"))
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+    defaults = {key.replace("-", "_"): value for key, value in manifest.get("defaults", {}).items()}
+    jobs = []
+    for entry in manifest.get("jobs", []):
+        entry = {key.replace("-", "_"): value for key, value in entry.items()}
+        command = entry.pop("command", None)
+        if command in JOBS:
+            accepted = inspect.signature(JOBS[command]).parameters
+            entry = {**{k: v for k, v in defaults.items() if k in accepted}, **entry}
+        uids = entry.pop("asset_uid", None)
+        for uid in uids if isinstance(uids, list) else [uids]:
+            options = {
+                key: value.replace("{asset_uid}", uid) if isinstance(value, str) and uid else value
+                for key, value in entry.items()
+            }
+            job = Job(command, uid, options)
+            job.validate()
+            jobs.append(job)
+    return {
+        "jobs": jobs,
+        "workers": manifest.get("workers"),
+        "requests_per_second": manifest.get("requests_per_second"),
+        "timeout": manifest.get("timeout"),
+    }
+
+
+class JobRunner:
+    """Runs a list of jobs across projects with a bounded worker pool
+
+    Jobs on the same asset run in manifest order on one FormManager, so an
+    update is never raced by a redeploy of the same form; by default the
+    rest of an asset's jobs are skipped after one fails. Different assets
+    run in parallel on up to ``max_workers`` threads on sibling
+    FormManagers sharing one connection pool and rate limiter (as in
+    MultiAssetManager). Jobs not started
+    within ``timeout`` seconds are skipped, so a nightly batch ends in a
+    bounded window.
+    """
+
+    def __init__(self, api_token: str, max_workers: int = 4, requests_per_second: float = 5.0,
+                 timeout: Optional[float] = None, stop_on_error: bool = True,
+                 snapshot_dir: Optional[str] = None, history: Optional[VersionStore] = None,
+                 **client_options):
+        self.api_token = api_token
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.stop_on_error = stop_on_error
+        self.snapshot_dir = snapshot_dir
+        self.history = history
+        self.client_options = client_options
+        self.rate_limiter = AsyncRateLimiter(requests_per_second)
+        self._root: Optional[FormManager] = None
+        self._root_lock = Lock()
+
+    def close(self):
+        if self._root is not None:
+            self._root.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def form(self, asset_uid: str) -> FormManager:
+        with self._root_lock:
+            if self._root is None:
+                self._root = FormManager(self.api_token, asset_uid, snapshot_dir=self.snapshot_dir,
+                                         history=self.history, pool_maxsize=self.max_workers,
+                                         rate_limiter=self.rate_limiter, **self.client_options)
+                return self._root
+        return self._root.sibling(asset_uid, self.snapshot_dir)
+
+    def run(self, jobs: Iterable[Job]) -> JobReport:
+        """Run ``jobs``; results keep the order of ``jobs``"""
+        started = time.perf_counter()
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        jobs = list(jobs)
+        by_asset: Dict[str, List[int]] = OrderedDict()
+        for index, job in enumerate(jobs):
+            by_asset.setdefault(job.asset_uid, []).append(index)
+        results: List[Optional[JobResult]] = [None] * len(jobs)
+
+        def run_asset(asset_uid: str):
+            try:
+                form = self.form(asset_uid)
+            except Exception as e:
+                for index in by_asset[asset_uid]:
+                    results[index] = JobResult(jobs[index].command, asset_uid, error=f"{type(e).__name__}: {e}")
+                return
+            failed = False
+            for index in by_asset[asset_uid]:
+                job = jobs[index]
+                if failed and self.stop_on_error:
+                    reason = "Skipped after an earlier job on this asset failed"
+                elif deadline is not None and time.monotonic() > deadline:
+                    reason = f"Skipped: batch timeout of {self.timeout:g}s reached"
+                else:
+                    results[index] = run_job(form, job)
+                    failed = failed or not results[index].ok
+                    continue
+                results[index] = JobResult(job.command, asset_uid, skipped=True, error=reason)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(run_asset, by_asset))
+        return JobReport(results, time.perf_counter() - started)
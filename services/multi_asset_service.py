@@ -0,0 +1,134 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from kobo_manager import Choice, FormManager
+from kobo_manager_async import AsyncRateLimiter
+
+
+@dataclass
+class AssetResult:
+    """Outcome of a batch operation on one asset"""
+    asset_uid: str
+    ok: bool = False
+    added: int = 0
+    skipped: int = 0
+    version_id: Optional[str] = None
+    deployed: bool = False
+    error: Optional[str] = None
+    duration: float = 0.0
+    value: Any = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "asset_uid": self.asset_uid,
+            "ok": self.ok,
+            "added": self.added,
+            "skipped": self.skipped,
+            "version_id": self.version_id,
+            "deployed": self.deployed,
+            "error": self.error,
+            "duration": round(self.duration, 3),
+        }
+
+
+@dataclass
+class BatchReport:
+    results: List[AssetResult] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return all(r.ok for r in self.results)
+
+    @property
+    def failed(self) -> List[AssetResult]:
+        return [r for r in self.results if not r.ok]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "ok": self.ok,
+            "assets": len(self.results),
+            "failed": len(self.failed),
+            "results": [r.as_dict() for r in self.results],
+        }
+
+
+class MultiAssetManager:
+    """Runs the same form operation across many assets concurrently
+
+    Every FormManager is a sibling of the first one, sharing its connection
+    pool and token-bucket rate limiter, so ``max_workers`` bounds concurrency
+    and ``requests_per_second`` bounds the load on the KoboToolbox host.
+    """
+
+    def __init__(self, api_token: str, asset_uids: Iterable[str], max_workers: int = 4,
+                 requests_per_second: float = 5.0, **client_options):
+        self.asset_uids = list(dict.fromkeys(asset_uids))
+        self.max_workers = max_workers
+        self.rate_limiter = AsyncRateLimiter(requests_per_second)
+        self.managers: Dict[str, FormManager] = {}
+        for uid in self.asset_uids:
+            if not self.managers:
+                self.managers[uid] = FormManager(api_token, uid, pool_maxsize=max_workers,
+                                                 rate_limiter=self.rate_limiter, **client_options)
+            else:
+                self.managers[uid] = self.managers[self.asset_uids[0]].sibling(uid)
+
+    def close(self):
+        # Siblings share the first manager's connections and event loop
+        if self.managers:
+            self.managers[self.asset_uids[0]].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def run(self, operation: Callable[[FormManager, AssetResult], Any]) -> BatchReport:
+        """Apply ``operation(form, result)`` to every asset
+
+        The operation fills in ``result``; raising marks the asset failed
+        without affecting the others. Results keep the order of asset_uids.
+        """
+        def run_one(uid: str) -> AssetResult:
+            result = AssetResult(uid)
+            started = time.perf_counter()
+            try:
+                result.value = operation(self.managers[uid], result)
+                if result.error is None:
+                    result.ok = True
+            except Exception as e:
+                result.error = str(e)
+            result.duration = time.perf_counter() - started
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return BatchReport(list(executor.map(run_one, self.asset_uids)))
+
+    def push_choices(self, choices: List[Choice], redeploy: bool = True) -> BatchReport:
+        """Fetch, add ``choices``, update and (optionally) redeploy every asset
+
+        Choices whose value already exists in an asset's list are skipped.
+        """
+        def push(form: FormManager, result: AssetResult):
+            if not form.fetch_form_structure():
+                result.error = "Failed to fetch form structure"
+                return
+            for choice in choices:
+                if form.choices.has_value(choice.list_name, choice.value):
+                    result.skipped += 1
+                elif form.add_choice(choice):
+                    result.added += 1
+            if result.added and not form.update_form():
+                result.error = "Form update failed"
+                return
+            result.version_id = form.latest_version_id
+            if redeploy and form.needs_redeploy():
+                if not form.redeploy_form():
+                    result.error = "Redeployment failed"
+                    return
+                result.deployed = True
+
+        return self.run(push)
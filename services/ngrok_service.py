@@ -1,15 +1,39 @@
-from pyngrok import ngrok
 import os
+from typing import Optional
+
+
+def _ngrok():
+    # Imported on first use: most runs sit behind a proxy or need no tunnel
+    try:
+        from pyngrok import ngrok
+    except ImportError as e:
+        raise ImportError("ngrok tunnels require pyngrok: pip install pyngrok") from e
+    return ngrok
+
 
 class NgrokService:
     """Manages ngrok tunnel configuration"""
-    
+
+    @staticmethod
+    def enabled() -> bool:
+        """Whether a tunnel should be opened: ``WEBHOOK_TUNNEL``, else if a token is set"""
+        setting = os.getenv("WEBHOOK_TUNNEL")
+        if setting is not None and setting != "":
+            return setting.lower() in ("1", "true", "yes", "ngrok")
+        return bool(os.getenv("NGROK_AUTH_TOKEN"))
+
     @staticmethod
     def initialize():
         """Initialize ngrok with auth token"""
-        ngrok.set_auth_token(os.getenv("NGROK_AUTH_TOKEN"))
-    
+        _ngrok().set_auth_token(os.getenv("NGROK_AUTH_TOKEN"))
+
     @staticmethod
     def get_public_url(port: int):
         """Create and return ngrok tunnel"""
-        return ngrok.connect(port).public_url
\ No newline at end of file
+        return _ngrok().connect(port).public_url
+
+    @staticmethod
+    def disconnect(public_url: Optional[str]):
+        """Close the tunnel opened for ``public_url``"""
+        if public_url:
+            _ngrok().disconnect(public_url)
@@ -0,0 +1,156 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from database.supabase_client import get_pool
+from kobo_manager import ChoiceColumns
+from utils.metrics import metrics
+from utils.text import fold_text, full_name, near_duplicates, normalize_labels
+
+NAME_QUERY = '''
+    SELECT nombre, "apellido paterno", "apellido materno"
+    FROM public."KoboOptionUpdateTest"
+'''
+
+SYNC_STAGE_SECONDS = metrics.histogram(
+    "kobo_sync_stage_seconds", "Duration of choice sync stages", ("stage",)
+)
+
+
+def build_value(nombre: str, paterno: str, materno: Optional[str]) -> str:
+    """Base choice value (``nombre_paterno_materno``) for a registry row
+
+    Accents are folded so values stay ASCII ("José Pérez" -> ``jose_perez``).
+    """
+    return "_".join(
+        "_".join(fold_text(part).split()) for part in (nombre, paterno, materno or "") if part and part.strip()
+    )
+
+
+@dataclass
+class SyncDiff:
+    """Changes needed to make a choice list match the registry"""
+    list_name: str
+    # Choice dicts, or a ChoiceColumns batch when built from the registry
+    added: Union[List[Dict], ChoiceColumns] = field(default_factory=list)
+    removed: List[Dict] = field(default_factory=list)
+    # (choice value, new label)
+    relabelled: List[Tuple[str, str]] = field(default_factory=list)
+    # (new label, similar label, kind) from near_duplicates; informational
+    similar: List[Tuple[str, str, str]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.relabelled)
+
+    def apply_to(self, catalogue):
+        """Apply the changes to a ChoiceCatalogue"""
+        catalogue.add_many(self.added)
+        if self.removed:
+            catalogue.remove(self.list_name, {c["name"] for c in self.removed})
+        for value, label in self.relabelled:
+            catalogue.set_label(self.list_name, value, label)
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "added": len(self.added),
+            "removed": len(self.removed),
+            "relabelled": len(self.relabelled),
+        }
+
+
+class OptionSyncEngine:
+    """Set-based sync of registry names into a form's choice list
+
+    Rows are streamed through a server-side cursor in batches, compared to
+    the list by normalised label, and the resulting diff is applied with a
+    single ``update_form`` PATCH.
+    """
+
+    def __init__(self, form_manager, db_config: Dict, list_name: str,
+                 batch_size: int = 5000, query: str = NAME_QUERY):
+        self.form = form_manager
+        self.db_config = db_config
+        self.list_name = list_name
+        self.batch_size = batch_size
+        self.query = query
+
+    def iter_batches(self) -> Iterator[List[Tuple]]:
+        """Yield batches of ``(nombre, paterno, materno)`` rows"""
+        pool = get_pool(self.db_config)
+        connection = pool.acquire()
+        try:
+            # Named cursors stay on the server; rows arrive batch_size at a time
+            with connection.cursor(name="kobo_option_sync") as cursor:
+                cursor.itersize = self.batch_size
+                cursor.execute(self.query)
+                while True:
+                    rows = cursor.fetchmany(self.batch_size)
+                    if not rows:
+                        break
+                    yield rows
+        finally:
+            pool.release(connection)
+
+    def load_registry(self) -> Dict[str, Tuple[str, str]]:
+        """Map normalised label -> (display label, base value) for every row"""
+        registry: Dict[str, Tuple[str, str]] = {}
+        with SYNC_STAGE_SECONDS.time(stage="registry"):
+            for rows in self.iter_batches():
+                labels = [full_name(*row) for row in rows]
+                keys = normalize_labels(labels)
+                for key, label, row in zip(keys, labels, rows):
+                    if key and key not in registry:
+                        registry[key] = (label, build_value(*row))
+        return registry
+
+    def compute_diff(self, remove_missing: bool = False, update_labels: bool = False,
+                     check_similar: bool = False) -> SyncDiff:
+        """Diff the registry against the current choice list
+
+        Additions are always computed. ``remove_missing`` also lists choices
+        whose label is no longer in the registry, ``update_labels`` lists
+        choices whose label only differs in case, accents or whitespace, and
+        ``check_similar`` flags additions that look like a typo of, or the
+        same name with a word missing as, another option (see
+        utils.text.near_duplicates).
+        """
+        catalogue = self.form.choices
+        if catalogue is None:
+            raise ValueError("Form structure not loaded - call fetch_form_structure first")
+
+        registry = self.load_registry()
+        diff = SyncDiff(self.list_name, added=ChoiceColumns(self.list_name))
+        reserved = set()
+        for key, (label, base_value) in registry.items():
+            existing = catalogue.find_by_label(self.list_name, label)
+            if existing is None:
+                value = catalogue.unique_value(self.list_name, base_value, taken=reserved)
+                reserved.add(value)
+                diff.added.append(value, label)
+            elif update_labels and catalogue.label_of(existing) != label:
+                diff.relabelled.append((existing["name"], label))
+
+        if remove_missing:
+            current = catalogue.choices(self.list_name)
+            keys = normalize_labels(catalogue.label_of(c) for c in current)
+            diff.removed = [c for c, key in zip(current, keys) if key not in registry]
+        if check_similar and diff.added:
+            diff.similar = self.similar_labels(diff.added.labels)
+        return diff
+
+    def similar_labels(self, new_labels: List[str]) -> List[Tuple[str, str, str]]:
+        """Near-duplicates of ``new_labels`` among themselves and the list"""
+        labels = [self.form.choices.label_of(c) for c in self.form.choices.choices(self.list_name)]
+        first_new = len(labels)
+        labels.extend(new_labels)
+        similar = []
+        for i, j, kind in near_duplicates(labels, among=range(first_new, len(labels))):
+            # j is the later position, so always one of the new labels
+            similar.append((labels[j], labels[i], kind))
+        return similar
+
+    def apply(self, diff: SyncDiff) -> bool:
+        """Apply a diff to the catalogue and push it in one form update"""
+        if not diff:
+            return True
+        diff.apply_to(self.form.choices)
+        return self.form.update_form()
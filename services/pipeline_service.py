@@ -0,0 +1,126 @@
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from kobo_manager import Choice, FormManager
+from services.option_sync_service import SYNC_STAGE_SECONDS, OptionSyncEngine, SyncDiff
+
+# Builds the changes to apply from a freshly fetched form
+Plan = Callable[[FormManager], SyncDiff]
+
+
+@dataclass
+class PipelineResult:
+    """Outcome and per-stage timing of one update/redeploy run"""
+    asset_uid: str
+    ok: bool = False
+    dry_run: bool = False
+    changes: Dict[str, int] = field(default_factory=dict)
+    version_id: Optional[str] = None
+    deployed: bool = False
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "asset_uid": self.asset_uid,
+            "ok": self.ok,
+            "dry_run": self.dry_run,
+            "changes": self.changes,
+            "version_id": self.version_id,
+            "deployed": self.deployed,
+            "error": self.error,
+            "timings": {stage: round(t, 4) for stage, t in self.timings.items()},
+        }
+
+
+def choices_plan(choices: Iterable[Choice]) -> Plan:
+    """Plan that adds ``choices`` whose value isn't in their list yet"""
+    def plan(form: FormManager) -> SyncDiff:
+        diff = SyncDiff(list_name="")
+        for choice in choices:
+            if not form.choices.has_value(choice.list_name, choice.value):
+                diff.added.append(choice.to_dict())
+        return diff
+    return plan
+
+
+def registry_plan(db_config: Dict, list_name: str, remove_missing: bool = False,
+                  update_labels: bool = False) -> Plan:
+    """Plan that syncs ``list_name`` with the registry table"""
+    def plan(form: FormManager) -> SyncDiff:
+        engine = OptionSyncEngine(form, db_config, list_name)
+        return engine.compute_diff(remove_missing=remove_missing, update_labels=update_labels)
+    return plan
+
+
+class UpdatePipeline:
+    """Headless fetch -> diff -> patch -> deploy cycle for one form
+
+    Nothing here prompts: ``confirm`` (if given) is called with the diff and
+    can veto it, ``dry_run`` stops after the diff, and ``max_changes`` aborts
+    runs that would change more choices than expected.
+    """
+
+    def __init__(self, form: FormManager, redeploy: bool = True, dry_run: bool = False,
+                 max_changes: Optional[int] = None,
+                 confirm: Optional[Callable[[SyncDiff], bool]] = None):
+        self.form = form
+        self.redeploy = redeploy
+        self.dry_run = dry_run
+        self.max_changes = max_changes
+        self.confirm = confirm
+
+    @staticmethod
+    @contextmanager
+    def _stage(result: PipelineResult, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            result.timings[name] = time.perf_counter() - started
+            SYNC_STAGE_SECONDS.observe(result.timings[name], stage=name)
+
+    def run(self, plan: Plan) -> PipelineResult:
+        result = PipelineResult(self.form.asset_uid, dry_run=self.dry_run)
+        try:
+            self._run(plan, result)
+        except Exception as e:
+            result.error = str(e)
+        result.ok = result.error is None
+        return result
+
+    def _run(self, plan: Plan, result: PipelineResult):
+        with self._stage(result, "fetch"):
+            if not self.form.fetch_form_structure():
+                result.error = "Failed to fetch form structure"
+                return
+
+        with self._stage(result, "diff"):
+            diff = plan(self.form)
+        result.changes = diff.summary()
+        total = sum(result.changes.values())
+        if self.max_changes is not None and total > self.max_changes:
+            result.error = f"{total} changes exceed max_changes={self.max_changes}"
+            return
+        if self.dry_run:
+            return
+        if self.confirm is not None and diff and not self.confirm(diff):
+            result.error = "Cancelled"
+            return
+
+        if diff:
+            with self._stage(result, "patch"):
+                diff.apply_to(self.form.choices)
+                if not self.form.update_form():
+                    result.error = "Form update failed"
+                    return
+        result.version_id = self.form.latest_version_id
+
+        if self.redeploy and self.form.needs_redeploy():
+            with self._stage(result, "deploy"):
+                if not self.form.redeploy_form():
+                    result.error = "Redeployment failed"
+                    return
+            result.deployed = True
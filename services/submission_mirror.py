@@ -0,0 +1,382 @@
+import json
+import os
+import sqlite3
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+MAIN_TABLE = "submissions"
+# Submission metadata kept as real columns; other keys outside the survey go to _extra
+META_COLUMNS = (
+    ("_id", "integer"),
+    ("_uuid", "text"),
+    ("_submission_time", "text"),
+    ("_submitted_by", "text"),
+    ("__version__", "text"),
+    ("_status", "text"),
+)
+# Columns of every repeat table: owning submission, position (e.g. "2.1") and parent position
+CHILD_KEY_COLUMNS = ("_submission_id", "_path", "_parent_path")
+EXTRA_COLUMN = "_extra"
+DEFAULT_INDEXES = ("_submission_time",)
+
+COLUMN_TYPES = {
+    "sqlite": {"integer": "INTEGER", "decimal": "REAL", "text": "TEXT"},
+    "duckdb": {"integer": "BIGINT", "decimal": "DOUBLE", "text": "VARCHAR"},
+}
+NUMERIC_QUESTIONS = {"integer": "integer", "decimal": "decimal", "range": "decimal"}
+# Survey rows that never carry a value
+NO_VALUE_TYPES = {"note", "begin_group", "end_group", "begin_repeat", "end_repeat"}
+# Bound parameters per IN (...) list; below SQLite's historic limit of 999
+DELETE_CHUNK = 500
+
+
+def quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+@dataclass
+class MirrorTable:
+    """One table of the mirror: the submissions or one repeat group"""
+    name: str
+    # xpath of the repeat group, None for the submissions table
+    xpath: Optional[str] = None
+    # submission key (xpath) -> (column, kind)
+    columns: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    # repeat xpath -> table of its entries
+    repeats: Dict[str, "MirrorTable"] = field(default_factory=dict)
+
+    @property
+    def key_columns(self) -> Tuple[str, ...]:
+        return () if self.xpath is None else CHILD_KEY_COLUMNS
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.key_columns) + [column for column, _ in self.columns.values()] + [EXTRA_COLUMN]
+
+    def add_column(self, xpath: str, name: str, kind: str):
+        taken = set(self.key_columns) | {column for column, _ in self.columns.values()} | {EXTRA_COLUMN}
+        # Names are only unique per group; fall back to the full path
+        column = name if name not in taken else xpath.replace("/", "__")
+        self.columns[xpath] = (column, kind)
+
+
+class SurveySchema:
+    """Tables of a mirror derived from a form's ``content.survey``
+
+    Questions become columns of the submissions table, named after the
+    question; each repeat group becomes a child table whose rows point back
+    to the submission (and to the parent entry for nested repeats).
+    """
+
+    def __init__(self, main: MirrorTable):
+        self.main = main
+
+    @classmethod
+    def from_survey(cls, survey: Iterable[Dict[str, Any]]) -> "SurveySchema":
+        main = MirrorTable(MAIN_TABLE)
+        for key, kind in META_COLUMNS:
+            main.add_column(key, key, kind)
+        table_names = {MAIN_TABLE}
+        # (group name, table the group's questions belong to)
+        stack: List[Tuple[str, MirrorTable]] = []
+        for row in survey:
+            row_type = (row.get("type") or "").replace(" ", "_")
+            name = row.get("name") or row.get("$autoname")
+            table = stack[-1][1] if stack else main
+            if row_type in ("end_group", "end_repeat"):
+                if stack:
+                    stack.pop()
+                continue
+            if not name:
+                continue
+            xpath = row.get("$xpath") or "/".join([group for group, _ in stack] + [name])
+            if row_type == "begin_group":
+                stack.append((name, table))
+            elif row_type == "begin_repeat":
+                table_name = name
+                while table_name in table_names:
+                    table_name += "_"
+                table_names.add(table_name)
+                child = MirrorTable(table_name, xpath)
+                table.repeats[xpath] = child
+                stack.append((name, child))
+            elif row_type not in NO_VALUE_TYPES:
+                table.add_column(xpath, name, NUMERIC_QUESTIONS.get(row_type, "text"))
+        return cls(main)
+
+    def tables(self) -> List[MirrorTable]:
+        """Every table, parents before their repeats"""
+        tables, pending = [], [self.main]
+        while pending:
+            table = pending.pop(0)
+            tables.append(table)
+            pending.extend(table.repeats.values())
+        return tables
+
+
+_MISSING = object()
+
+
+def _convert(value: Any, kind: str) -> Any:
+    """Column value for ``kind``; _MISSING if a number does not parse"""
+    if value is None:
+        return None
+    try:
+        if kind == "integer":
+            return value if isinstance(value, int) else int(float(value))
+        if kind == "decimal":
+            return float(value)
+    except (TypeError, ValueError):
+        return _MISSING
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value if isinstance(value, str) else str(value)
+
+
+class SubmissionMirror:
+    """Submissions upserted into a local SQLite or DuckDB file
+
+    Rows are keyed on ``_id`` with a unique index on ``_uuid``, so writing a
+    submission again replaces it (and its repeat entries) instead of adding
+    a copy. ``indexes`` lists further columns to index, ``"column"`` for the
+    submissions table or ``"repeat.column"`` for a repeat table. DuckDB
+    needs ``pip install duckdb`` and is picked for ``.duckdb`` files.
+    """
+
+    def __init__(self, path, survey: Optional[Iterable[Dict]] = None, backend: Optional[str] = None,
+                 indexes: Sequence[str] = DEFAULT_INDEXES):
+        self.path = Path(path)
+        self.backend = backend or ("duckdb" if self.path.suffix.lower() == ".duckdb" else "sqlite")
+        if self.backend not in COLUMN_TYPES:
+            raise ValueError(f"Unsupported mirror backend: {self.backend}")
+        self.schema = SurveySchema.from_survey(survey or [])
+        self.indexes = tuple(indexes)
+        self.connection = self._connect()
+
+    def _connect(self):
+        if self.backend == "duckdb":
+            try:
+                import duckdb
+            except ImportError as e:
+                raise ImportError("DuckDB mirrors require duckdb: pip install duckdb") from e
+            return duckdb.connect(str(self.path))
+        return sqlite3.connect(str(self.path))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _begin(self):
+        # sqlite3 opens transactions implicitly; DuckDB autocommits every statement
+        if self.backend == "duckdb":
+            self.connection.begin()
+
+    def _columns_of(self, table: str) -> List[str]:
+        cursor = self.connection.execute(f"SELECT * FROM {quote(table)} LIMIT 0")
+        return [d[0] for d in cursor.description]
+
+    def _column_kinds(self, table: MirrorTable) -> Dict[str, str]:
+        kinds = {column: "text" for column in table.key_columns}
+        if table.xpath is not None:
+            kinds["_submission_id"] = "integer"
+        kinds.update(table.columns.values())
+        kinds[EXTRA_COLUMN] = "text"
+        return kinds
+
+    def create(self):
+        """Create missing tables, and columns for questions added to the form"""
+        types = COLUMN_TYPES[self.backend]
+        for table in self.schema.tables():
+            kinds = self._column_kinds(table)
+            definitions = [f"{quote(column)} {types[kind]}" for column, kind in kinds.items()]
+            if table.xpath is None:
+                definitions[0] += " PRIMARY KEY"
+            else:
+                definitions.append("PRIMARY KEY (_submission_id, _path)")
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {quote(table.name)} ({', '.join(definitions)})"
+            )
+            existing = set(self._columns_of(table.name))
+            for column, kind in kinds.items():
+                if column not in existing:
+                    self.connection.execute(
+                        f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column)} {types[kind]}"
+                    )
+        self.connection.commit()
+
+    def index_plan(self) -> List[Tuple[str, str, bool]]:
+        """``(table, column, unique)`` of every index; checks the configured ones exist"""
+        tables = {table.name: table for table in self.schema.tables()}
+        wanted = [(MAIN_TABLE, "_uuid", True)]
+        wanted += [(name, "_submission_id", False) for name in tables if name != MAIN_TABLE]
+        for spec in self.indexes:
+            table_name, _, column = spec.rpartition(".")
+            table_name = table_name or MAIN_TABLE
+            if table_name not in tables or column not in self._columns_of(table_name):
+                raise ValueError(f"Cannot index {spec}: no such mirror column")
+            wanted.append((table_name, column, False))
+        return wanted
+
+    def create_indexes(self):
+        """Create the ``_uuid``, repeat and configured indexes if missing"""
+        for table_name, column, unique in self.index_plan():
+            index = quote(f"ix_{table_name}_{column}")
+            self.connection.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index} "
+                f"ON {quote(table_name)} ({quote(column)})"
+            )
+        self.connection.commit()
+
+    def _rows(self, table: MirrorTable, record: Dict, key: Tuple, rows: Dict[str, List[Tuple]]):
+        """Append the row of ``record`` (and of its repeat entries) to ``rows``"""
+        values = dict.fromkeys(column for column, _ in table.columns.values())
+        extra = {}
+        for name, value in record.items():
+            column = table.columns.get(name)
+            if column is not None:
+                converted = _convert(value, column[1])
+                if converted is _MISSING:
+                    extra[name] = value
+                else:
+                    values[column[0]] = converted
+            elif name in table.repeats and isinstance(value, list):
+                submission_id, path = (key[0], key[1]) if key else (record.get("_id"), None)
+                for position, entry in enumerate(value, 1):
+                    child_path = f"{path}.{position}" if path else str(position)
+                    self._rows(table.repeats[name], entry, (submission_id, child_path, path), rows)
+            else:
+                extra[name] = value
+        row = key + tuple(values.values()) + (json.dumps(extra, ensure_ascii=False) if extra else None,)
+        rows.setdefault(table.name, []).append(row)
+
+    def _delete(self, records: List[Dict]):
+        """Remove stored copies of ``records`` (by ``_id`` or ``_uuid``)"""
+        ids = {r["_id"] for r in records if r.get("_id") is not None}
+        uuids = [r["_uuid"] for r in records if r.get("_uuid")]
+        for start in range(0, len(uuids), DELETE_CHUNK):
+            chunk = uuids[start:start + DELETE_CHUNK]
+            ids.update(row[0] for row in self.connection.execute(
+                f"SELECT _id FROM {quote(MAIN_TABLE)} WHERE _uuid IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        ids = list(ids)
+        for table in reversed(self.schema.tables()):
+            key = "_id" if table.xpath is None else "_submission_id"
+            for start in range(0, len(ids), DELETE_CHUNK):
+                chunk = ids[start:start + DELETE_CHUNK]
+                self.connection.execute(
+                    f"DELETE FROM {quote(table.name)} WHERE {key} IN ({', '.join('?' * len(chunk))})", chunk
+                )
+
+    def _insert(self, table: MirrorTable, rows: List[Tuple]):
+        columns = table.column_names
+        column_list = ", ".join(map(quote, columns))
+        if self.backend == "sqlite":
+            self.connection.executemany(
+                f"INSERT INTO {quote(table.name)} ({column_list}) VALUES ({', '.join('?' * len(columns))})", rows
+            )
+            return
+        # DuckDB binds parameters row by row, which is far slower than its JSON reader
+        types = COLUMN_TYPES[self.backend]
+        kinds = self._column_kinds(table)
+        spec = ", ".join(
+            "'{}': '{}'".format(column.replace("'", "''"), types[kinds[column]]) for column in columns
+        )
+        handle, staging = tempfile.mkstemp(suffix=".ndjson", dir=self.path.parent)
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+            self.connection.execute(
+                f"INSERT INTO {quote(table.name)} ({column_list}) SELECT {column_list} "
+                f"FROM read_json(?, format = 'newline_delimited', columns = {{{spec}}})",
+                [staging]
+            )
+        finally:
+            os.remove(staging)
+
+    def upsert(self, records: List[Dict], replace: bool = True) -> int:
+        """Write ``records``, replacing stored versions of the same submissions
+
+        ``replace=False`` skips the lookup of existing rows; only use it for
+        records known to be new, e.g. while filling an empty mirror.
+        """
+        if not records:
+            return 0
+        rows: Dict[str, List[Tuple]] = {}
+        for record in records:
+            self._rows(self.schema.main, record, (), rows)
+        self._begin()
+        try:
+            if replace:
+                self._delete(records)
+                if self.backend == "duckdb":
+                    # DuckDB checks keys against rows deleted in the same transaction
+                    self.connection.commit()
+                    self._begin()
+            for table in self.schema.tables():
+                if table.name in rows:
+                    self._insert(table, rows[table.name])
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        return len(records)
+
+    def has_submission(self, uuid: str) -> bool:
+        """True if a submission with this ``_uuid`` is stored"""
+        return self.connection.execute(
+            f"SELECT 1 FROM {quote(MAIN_TABLE)} WHERE _uuid = ? LIMIT 1", [uuid]
+        ).fetchone() is not None
+
+    def count(self, table: str = MAIN_TABLE) -> int:
+        return self.connection.execute(f"SELECT COUNT(*) FROM {quote(table)}").fetchone()[0]
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> List[Tuple]:
+        return self.connection.execute(sql, list(params)).fetchall()
+
+
+class MirrorSink:
+    """Export sink that upserts into a SubmissionMirror
+
+    A full export starts from an empty file and builds the indexes once all
+    rows are in; appends (resume, incremental) replace rows already stored.
+    """
+    backend = "sqlite"
+
+    def __init__(self, path: Path, append: bool = False, survey: Optional[Iterable[Dict]] = None,
+                 indexes: Sequence[str] = DEFAULT_INDEXES):
+        path = Path(path)
+        if not append:
+            for stale in (path, path.with_name(path.name + ".wal")):
+                if stale.exists():
+                    stale.unlink()
+        self.mirror = SubmissionMirror(path, survey, backend=self.backend, indexes=indexes)
+        self._fresh = not append
+        self.mirror.create()
+        if append:
+            self.mirror.create_indexes()
+        else:
+            # Fail before downloading anything if an index names a missing column
+            self.mirror.index_plan()
+
+    def write(self, records: List[Dict]) -> bool:
+        self.mirror.upsert(records, replace=not self._fresh)
+        return True
+
+    def close(self) -> bool:
+        try:
+            if self._fresh:
+                self.mirror.create_indexes()
+        finally:
+            self.mirror.close()
+        return True
+
+
+class DuckDBMirrorSink(MirrorSink):
+    backend = "duckdb"
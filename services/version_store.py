@@ -0,0 +1,254 @@
+import hashlib
+import json
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+# Sections of asset content stored element by element; the rest is one object
+SECTIONS = ("survey", "choices")
+# A chunk ends after an element whose hash hits the mask (~64 elements on
+# average), so an edit only changes the chunks around it
+CHUNK_MASK = 0x3F
+MAX_CHUNK = 1024
+# Bound parameters per IN (...) list; below SQLite's historic limit of 999
+LOOKUP_CHUNK = 500
+
+
+def object_hash(body: str) -> str:
+    return hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+
+
+_ENCODER = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+_canonical = _ENCODER.encode
+
+
+def element_key(section: str, element: Dict[str, Any]) -> Tuple:
+    """Identity of a survey row or choice across versions"""
+    if section == "choices":
+        return (element.get("list_name"), element.get("name"))
+    return (element.get("$kuid") or element.get("name") or element.get("$autoname"),)
+
+
+@dataclass
+class SectionDiff:
+    """Changes to the survey rows or choices between two versions"""
+    added: List[Dict] = field(default_factory=list)
+    removed: List[Dict] = field(default_factory=list)
+    # (old element, new element) with the same key
+    changed: List[Tuple[Dict, Dict]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def summary(self) -> Dict[str, int]:
+        return {"added": len(self.added), "removed": len(self.removed), "changed": len(self.changed)}
+
+
+@dataclass
+class VersionDiff:
+    old_version: str
+    new_version: str
+    survey: SectionDiff = field(default_factory=SectionDiff)
+    choices: SectionDiff = field(default_factory=SectionDiff)
+    # Top-level content keys (settings, translations, ...) whose value changed
+    other: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.survey or self.choices or self.other)
+
+    def summary(self) -> Dict[str, Any]:
+        return {"survey": self.survey.summary(), "choices": self.choices.summary(), "other": self.other}
+
+
+class VersionStore:
+    """Content-addressed history of asset ``content`` in a local SQLite file
+
+    Every survey row and choice is stored once by the hash of its canonical
+    JSON; a version is a list of content-defined chunks of element hashes,
+    so two versions differing in a few choices share all other chunks and
+    cost little to store. Diffs only open the chunks that differ.
+    """
+
+    def __init__(self, path: str = "form_history.db"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS objects (
+                hash TEXT PRIMARY KEY,
+                body TEXT NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS versions (
+                asset_uid TEXT NOT NULL,
+                version_id TEXT NOT NULL,
+                saved_at REAL NOT NULL,
+                survey TEXT NOT NULL,
+                choices TEXT NOT NULL,
+                other TEXT NOT NULL,
+                PRIMARY KEY (asset_uid, version_id)
+            )
+        ''')
+
+    @classmethod
+    def in_dir(cls, directory: str) -> "VersionStore":
+        return cls(str(Path(directory) / "form_history.db"))
+
+    def close(self):
+        self._conn.close()
+
+    def has_version(self, asset_uid: str, version_id: str) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM versions WHERE asset_uid = ? AND version_id = ?", (asset_uid, version_id)
+        ).fetchone() is not None
+
+    def versions(self, asset_uid: str) -> List[Tuple[str, float]]:
+        """``(version_id, saved_at)`` of every stored version, oldest first"""
+        return self._conn.execute(
+            "SELECT version_id, saved_at FROM versions WHERE asset_uid = ? ORDER BY saved_at", (asset_uid,)
+        ).fetchall()
+
+    def _stored(self, hashes: Iterable[str]) -> Set[str]:
+        hashes = list(hashes)
+        stored = set()
+        for start in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[start:start + LOOKUP_CHUNK]
+            stored.update(row[0] for row in self._conn.execute(
+                f"SELECT hash FROM objects WHERE hash IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+        return stored
+
+    def _chunk(self, hashes: List[str], bodies: Dict[str, str], objects: Dict[str, str]) -> str:
+        """Queue ``hashes`` as content-defined chunks in ``objects``; returns the root hash
+
+        Elements (from ``bodies``) are only queued for chunks not stored yet.
+        """
+        chunks, current = [], []
+        for h in hashes:
+            current.append(h)
+            if int(h[-4:], 16) & CHUNK_MASK == 0 or len(current) >= MAX_CHUNK:
+                chunks.append(current)
+                current = []
+        if current:
+            chunks.append(current)
+        chunk_bodies = [_canonical(chunk) for chunk in chunks]
+        roots = [object_hash(body) for body in chunk_bodies]
+        stored = self._stored(roots)
+        for chunk, root, body in zip(chunks, roots, chunk_bodies):
+            if root not in stored:
+                objects[root] = body
+                objects.update((h, bodies[h]) for h in chunk)
+        body = _canonical(roots)
+        objects[object_hash(body)] = body
+        return object_hash(body)
+
+    def record(self, asset_uid: str, version_id: str, content: Dict[str, Any]) -> bool:
+        """Store ``content`` as ``version_id``; False if it was already stored"""
+        if not version_id or self.has_version(asset_uid, version_id):
+            return False
+        objects: Dict[str, str] = {}
+        roots = {}
+        for section in SECTIONS:
+            bodies = {}
+            hashes = []
+            for element in content.get(section, []):
+                body = _canonical(element)
+                h = object_hash(body)
+                bodies[h] = body
+                hashes.append(h)
+            roots[section] = self._chunk(hashes, bodies, objects)
+        other = _canonical({k: v for k, v in content.items() if k not in SECTIONS})
+        objects[object_hash(other)] = other
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT OR IGNORE INTO objects (hash, body) VALUES (?, ?)",
+                                       objects.items())
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO versions (asset_uid, version_id, saved_at, survey, choices, other) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (asset_uid, version_id, time.time(), roots["survey"], roots["choices"], object_hash(other))
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def _objects(self, hashes: Iterable[str]) -> Dict[str, Any]:
+        hashes = list(set(hashes))
+        found = {}
+        for start in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[start:start + LOOKUP_CHUNK]
+            found.update(self._conn.execute(
+                f"SELECT hash, body FROM objects WHERE hash IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        missing = set(hashes) - set(found)
+        if missing:
+            raise KeyError(f"Version history is missing {len(missing)} objects")
+        return {h: json.loads(body) for h, body in found.items()}
+
+    def _roots(self, asset_uid: str, version_id: str) -> Tuple[str, str, str]:
+        row = self._conn.execute(
+            "SELECT survey, choices, other FROM versions WHERE asset_uid = ? AND version_id = ?",
+            (asset_uid, version_id)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Version {version_id} of {asset_uid} is not in the history")
+        return row
+
+    def load(self, asset_uid: str, version_id: str) -> Dict[str, Any]:
+        """Rebuild the ``content`` stored for ``version_id``"""
+        survey_root, choices_root, other = self._roots(asset_uid, version_id)
+        content = self._objects([other])[other]
+        for section, root in zip(SECTIONS, (survey_root, choices_root)):
+            chunk_hashes = self._objects([root])[root]
+            chunks = self._objects(chunk_hashes)
+            hashes = [h for chunk_hash in chunk_hashes for h in chunks[chunk_hash]]
+            elements = self._objects(hashes)
+            content[section] = [elements[h] for h in hashes]
+        return content
+
+    def _diff_section(self, section: str, old_root: str, new_root: str) -> SectionDiff:
+        diff = SectionDiff()
+        if old_root == new_root:
+            return diff
+        roots = self._objects([old_root, new_root])
+        old_chunks, new_chunks = set(roots[old_root]), set(roots[new_root])
+        # Shared chunks hold the same elements on both sides; only open the others
+        changed = self._objects((old_chunks ^ new_chunks))
+        old_hashes: Set[str] = {h for c in old_chunks - new_chunks for h in changed[c]}
+        new_hashes: Set[str] = {h for c in new_chunks - old_chunks for h in changed[c]}
+        # Elements that only moved to another chunk cancel out
+        old_hashes, new_hashes = old_hashes - new_hashes, new_hashes - old_hashes
+        elements = self._objects(old_hashes | new_hashes)
+        old_by_key = {element_key(section, elements[h]): elements[h] for h in old_hashes}
+        for h in new_hashes:
+            element = elements[h]
+            previous = old_by_key.pop(element_key(section, element), None)
+            if previous is None:
+                diff.added.append(element)
+            else:
+                diff.changed.append((previous, element))
+        diff.removed = list(old_by_key.values())
+        return diff
+
+    def diff(self, asset_uid: str, old_version: str, new_version: str) -> VersionDiff:
+        """Structural changes from ``old_version`` to ``new_version``"""
+        old_roots = self._roots(asset_uid, old_version)
+        new_roots = self._roots(asset_uid, new_version)
+        result = VersionDiff(old_version, new_version)
+        result.survey = self._diff_section("survey", old_roots[0], new_roots[0])
+        result.choices = self._diff_section("choices", old_roots[1], new_roots[1])
+        if old_roots[2] != new_roots[2]:
+            others = self._objects([old_roots[2], new_roots[2]])
+            old, new = others[old_roots[2]], others[new_roots[2]]
+            result.other = sorted(k for k in set(old) | set(new) if old.get(k) != new.get(k))
+        return result
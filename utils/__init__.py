@@ -1,9 +1,35 @@
-from .console import (
-    console,
-    display_header,
-    get_credentials,
-    save_credentials,
-    login_prompt,
-    validate_api_token,
-    validate_asset_uid
+import importlib
+
+from dotenv import load_dotenv
+
+from .text import (
+    fold_text,
+    normalize_label,
+    normalize_labels,
+    full_name,
+    name_key,
+    registry_key,
+    near_duplicates
 )
+
+load_dotenv()
+
+# utils.console imports rich; it is only loaded once one of these is used
+_CONSOLE_NAMES = (
+    "console",
+    "display_header",
+    "get_credentials",
+    "save_credentials",
+    "login_prompt",
+    "validate_api_token",
+    "validate_asset_uid",
+)
+
+
+def __getattr__(name):
+    if name not in _CONSOLE_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    console_module = importlib.import_module(".console", __name__)
+    # Importing the submodule bound ``console`` to it; rebind to the Console object
+    globals().update((n, getattr(console_module, n)) for n in _CONSOLE_NAMES)
+    return globals()[name]
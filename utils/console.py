@@ -5,8 +5,6 @@ from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
 from rich.theme import Theme
-from dotenv import load_dotenv
-import keyring
 import os
 
 # Define custom theme
@@ -18,7 +16,6 @@ custom_theme = Theme({
     "prompt": "bold cyan",
     "header": "bold magenta",
 })
-load_dotenv()
 # Create console instance
 console = Console(theme=custom_theme)
 
@@ -62,6 +59,7 @@ def validate_asset_uid(uid: str) -> bool:
 def get_credentials() -> Optional[Tuple[str, str]]:
     """Retrieve credentials from system keyring"""
     try:
+        import keyring
         api_token = keyring.get_password("kobo_toolbox", "api_token")
         asset_uid = keyring.get_password("kobo_toolbox", "asset_uid")
         return (api_token, asset_uid) if api_token and asset_uid else None
@@ -72,6 +70,7 @@ def get_credentials() -> Optional[Tuple[str, str]]:
 def save_credentials(api_token: str, asset_uid: str):
     """Store credentials in system keyring"""
     try:
+        import keyring
         keyring.set_password("kobo_toolbox", "api_token", api_token)
         keyring.set_password("kobo_toolbox", "asset_uid", asset_uid)
         console.print("Credentials securely stored in system keyring", style="success")
@@ -0,0 +1,136 @@
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def _strip_marks(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _fold_pairs() -> List[Tuple[str, str]]:
+    """(accented letter, plain letter) for Latin-1 and Latin Extended-A/B"""
+    pairs = []
+    for code in range(0xC0, 0x250):
+        char = chr(code)
+        plain = _strip_marks(char).lower()
+        if len(plain) == 1 and plain != char.lower() and plain.isascii():
+            pairs.append((char, plain))
+    return pairs
+
+
+FOLD_PAIRS = _fold_pairs()
+# Single-character folds applied with str.translate; database.name_index
+# builds its SQL TRANSLATE() from the same pairs so name_key stays in sync
+_FOLD_TABLE = str.maketrans(dict(FOLD_PAIRS))
+
+
+def fold_text(text: str) -> str:
+    """Lowercase ``text`` and remove accents ("Pérez" -> "perez")"""
+    folded = text.lower().translate(_FOLD_TABLE)
+    if not folded.isascii():
+        # Characters outside the table (rare): full Unicode decomposition
+        folded = _strip_marks(folded)
+    return folded
+
+
+def normalize_label(label: str) -> str:
+    """Canonical form used to compare choice labels and registry names
+
+    Case and accents are folded and runs of whitespace collapsed, so
+    "  Ana  PÉREZ " and "ana perez" compare equal.
+    """
+    return " ".join(fold_text(label).split())
+
+
+def normalize_labels(labels: Iterable[Optional[str]]) -> List[str]:
+    """normalize_label over a whole list (None becomes "")"""
+    table = _FOLD_TABLE
+    keys = []
+    for label in labels:
+        if not label:
+            keys.append("")
+            continue
+        folded = label.lower().translate(table)
+        if not folded.isascii():
+            folded = _strip_marks(folded)
+        keys.append(" ".join(folded.split()))
+    return keys
+
+
+def full_name(nombre: str, paterno: str, materno: Optional[str] = None) -> str:
+    """Display name of a registry entry (``nombre paterno materno``)"""
+    return " ".join(" ".join(part.split()) for part in (nombre, paterno, materno or "") if part and part.strip())
+
+
+def registry_key(name: str) -> str:
+    """normalize_label folding only the FOLD_PAIRS letters
+
+    This is exactly what the SQL TRANSLATE() behind the registry's name_key
+    column does, so keys computed here find the stored rows. Letters outside
+    the table are kept as they are on both sides.
+    """
+    return " ".join(name.lower().translate(_FOLD_TABLE).split())
+
+
+def name_key(nombre: str, paterno: str, materno: Optional[str] = None) -> str:
+    """Normalised full name, as stored in the registry's name_key column"""
+    return registry_key(full_name(nombre, paterno, materno))
+
+
+def _deletions(key: str) -> Set[str]:
+    """``key`` with each single character removed"""
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def near_duplicates(names: Iterable[Optional[str]], min_length: int = 6,
+                    among: Optional[Iterable[int]] = None) -> List[Tuple[int, int, str]]:
+    """Pairs ``(i, j, kind)`` of names that are probably the same person
+
+    Names are normalised first; names that are then equal are not
+    reported, normalize_label already treats them as one. ``kind`` is
+    ``"typo"`` when one character was changed, added or dropped (names of
+    at least ``min_length`` characters), or ``"missing_word"`` when one
+    name is the other without one of its words (e.g. no apellido materno).
+    With ``among`` only pairs involving one of those positions are kept.
+
+    Both checks are hash joins on derived keys (single-character deletions
+    and one-word-shorter names), so no pair of names is compared directly
+    and 100k names take seconds.
+    """
+    keys = normalize_labels(names)
+    among = set(among) if among is not None else None
+    # First position of every distinct key
+    positions: Dict[str, int] = {}
+    for position, key in enumerate(keys):
+        if key:
+            positions.setdefault(key, position)
+
+    found: Dict[Tuple[int, int], str] = {}
+
+    def report(a: str, b: str, kind: str):
+        i, j = sorted((positions[a], positions[b]))
+        if among is None or i in among or j in among:
+            found.setdefault((i, j), kind)
+
+    for key in positions:
+        words = key.split(" ")
+        if len(words) < 3:
+            continue
+        for n in range(len(words)):
+            shorter = " ".join(words[:n] + words[n + 1:])
+            if shorter in positions:
+                report(shorter, key, "missing_word")
+
+    variants: Dict[str, List[str]] = {}
+    for key in positions:
+        if len(key) < min_length:
+            continue
+        # A key sharing a variant with another is one edit away from it
+        for variant in _deletions(key) | {key}:
+            variants.setdefault(variant, []).append(key)
+    for group in variants.values():
+        for n, a in enumerate(group):
+            for b in group[n + 1:]:
+                report(a, b, "typo")
+
+    return [(i, j, kind) for (i, j), kind in sorted(found.items())]